@@ -1,6 +1,7 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_migrate
 from django.core.signals import request_finished
+from django.contrib.auth import get_user_model
 
 # internal
 
@@ -9,11 +10,42 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
-        from api.receivers import (auto_bid_receiver_on_bid_save,
-                                   receiver_on_autobid_save,
+        from api.cache import check_shared_cache
+        check_shared_cache()
+
+        from api.receivers import (dispatch_receiver_on_bid_save,
+                                   dispatch_receiver_on_autobid_save,
+                                   orderbook_receiver_on_autobid_save,
+                                   orderbook_receiver_on_autobid_delete,
+                                   search_receiver_on_item_save,
+                                   search_receiver_on_item_delete,
+                                   search_receiver_on_post_migrate,
+                                   imaging_receiver_on_image_save,
+                                   cache_receiver_on_item_change,
+                                   cache_receiver_on_item_child_change,
+                                   auth_receiver_on_user_change,
                                    )
         Bid = self.get_model('Bid')
-        post_save.connect(auto_bid_receiver_on_bid_save, sender=Bid)
+        post_save.connect(dispatch_receiver_on_bid_save, sender=Bid)
 
         AutoBid = self.get_model('AutoBid')
-        post_save.connect(receiver_on_autobid_save, sender=AutoBid)
\ No newline at end of file
+        # the book must see the change before the dispatch evaluates it
+        post_save.connect(orderbook_receiver_on_autobid_save, sender=AutoBid)
+        post_delete.connect(orderbook_receiver_on_autobid_delete, sender=AutoBid)
+        post_save.connect(dispatch_receiver_on_autobid_save, sender=AutoBid)
+
+        Item = self.get_model('Item')
+        post_save.connect(search_receiver_on_item_save, sender=Item)
+        post_delete.connect(search_receiver_on_item_delete, sender=Item)
+        post_migrate.connect(search_receiver_on_post_migrate, sender=self)
+
+        Image = self.get_model('Image')
+        post_save.connect(imaging_receiver_on_image_save, sender=Image)
+        for signal in (post_save, post_delete):
+            signal.connect(cache_receiver_on_item_change, sender=Item)
+            signal.connect(cache_receiver_on_item_child_change, sender=Image)
+        post_delete.connect(cache_receiver_on_item_child_change, sender=Bid)
+
+        User = get_user_model()
+        for signal in (post_save, post_delete):
+            signal.connect(auth_receiver_on_user_change, sender=User)
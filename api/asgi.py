@@ -0,0 +1,83 @@
+import asyncio
+import re
+# internals
+from .stream import get_hub
+
+WEBSOCKET_PATH = re.compile(r'^/ws/items/(?P<item_id>\d+)/$')
+SSE_PATH = re.compile(r'^/api/v1/items/(?P<item_id>\d+)/stream/$')
+
+
+async def _forward(subscription, send, message):
+    async for payload in subscription:
+        await send(message(payload))
+
+
+async def websocket_item_stream(scope, receive, send, item_id):
+    """
+    Pushes the events of one item as text frames. Messages from the
+    client are ignored, the subscription ends when it disconnects.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+
+    subscription = get_hub().subscribe(item_id)
+    forward = asyncio.ensure_future(_forward(
+        subscription, send,
+        lambda payload: {'type': 'websocket.send', 'text': payload}))
+    try:
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+    finally:
+        forward.cancel()
+        subscription.close()
+
+
+async def sse_item_stream(scope, receive, send, item_id):
+    """
+    Same events as Server-Sent Events, for clients that can't open a
+    WebSocket.
+    """
+    subscription = get_hub().subscribe(item_id)
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache')],
+    })
+    forward = asyncio.ensure_future(_forward(
+        subscription, send,
+        lambda payload: {'type': 'http.response.body',
+                         'body': f'data: {payload}\n\n'.encode(),
+                         'more_body': True}))
+    try:
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+    finally:
+        forward.cancel()
+        subscription.close()
+
+
+def stream_router(django_application):
+    """
+    Serves the item streams on the ASGI entry point and hands everything
+    else to Django.
+    """
+    async def application(scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] == 'websocket':
+            match = WEBSOCKET_PATH.match(path)
+            if match:
+                return await websocket_item_stream(
+                    scope, receive, send, int(match['item_id']))
+            await receive()
+            return await send({'type': 'websocket.close'})
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = SSE_PATH.match(path)
+            if match:
+                return await sse_item_stream(
+                    scope, receive, send, int(match['item_id']))
+        return await django_application(scope, receive, send)
+
+    return application
@@ -0,0 +1,79 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache(object):
+    """
+    LRU of the most recently authenticated `max_size` active users by id.
+    User saves and deletes evict them in this process, `ttl` bounds how
+    long a change made by another process goes unseen.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None:
+                return None
+            user, cached_at = entry
+            if time.monotonic() - cached_at >= self.ttl:
+                del self.users[user_id]
+                return None
+            self.users.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self.lock:
+            self.users[user_id] = (user, time.monotonic())
+            self.users.move_to_end(user_id)
+            if len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+
+
+_users = None
+_users_lock = threading.Lock()
+
+
+def get_user_cache() -> UserCache:
+    global _users
+    if _users is None:
+        with _users_lock:
+            if _users is None:
+                _users = UserCache(settings.JWT_USER_CACHE_SIZE,
+                                   settings.JWT_USER_CACHE_TTL)
+    return _users
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the auth_user query per request: the user of
+    a token is read once and kept in the UserCache. Each request gets its
+    own copy, so nothing a view sets on it leaks into another request.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        users = get_user_cache()
+        user = users.get(user_id) if user_id is not None else None
+        if user is None:
+            user = super().get_user(validated_token)
+            users.set(user_id, user)
+        return copy.copy(user)
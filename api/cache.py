@@ -0,0 +1,68 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+
+# caches each process keeps to itself
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', )
+
+
+def check_shared_cache():
+    """
+    Item versions, idempotency keys and throttle buckets live in the
+    default cache. Several workers on a per-process cache each keep their
+    own versions, one that doesn't see a write keeps answering 304s with
+    its old ETag.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.WEB_WORKERS > 1 and backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f'{settings.WEB_WORKERS} workers (WEB_WORKERS) need a shared default '
+            f'cache, not {backend}: set CACHE_BACKEND and CACHE_LOCATION.')
+
+
+def _version_key(item_id):
+    return f'item:{item_id}:version'
+
+
+def _detail_key(item_id, version):
+    return f'item:{item_id}:detail:{version}'
+
+
+def item_version(item_id) -> int:
+    """
+    Version of an item's detail representation, part of its ETag: the
+    time (ns) it was last invalidated. A version lost to eviction restarts
+    from now and never repeats an old ETag.
+    """
+    version = cache.get(_version_key(item_id))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_version_key(item_id), version, None):
+            version = cache.get(_version_key(item_id), version)
+    return version
+
+
+def bump_item_version(item_id):
+    cache.set(_version_key(item_id), time.time_ns(), None)
+
+
+def invalidate_item(item_id, using=None):
+    """
+    Bumps the version now, so in-flight readers stop using the cached
+    detail, and again after commit, so a reader that cached the
+    pre-commit state in between is not served any longer.
+    """
+    bump_item_version(item_id)
+    transaction.on_commit(lambda: bump_item_version(item_id), using=using)
+
+
+def get_item_detail(item_id, version):
+    return cache.get(_detail_key(item_id, version))
+
+
+def set_item_detail(item_id, version, data):
+    cache.set(_detail_key(item_id, version), data,
+              settings.ITEM_DETAIL_CACHE_TIMEOUT)
@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+from django.conf import settings
+from django.db import close_old_connections, transaction
+# internals
+from .cache import bump_item_version
+from .models import Bid
+from .services import BidService
+from .signals import bid_placed
+from .stats import StatsRollup
+from .stream import publish_bid
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher(object):
+    """
+    In-process work queue keyed by item. Events submitted for an item that
+    is already waiting are merged into its pending batch, and an item is
+    handled by one worker at a time, so `handler(item_id, events)` sees
+    every event once, in order, batched as much as the load allows.
+    """
+
+    def __init__(self, handler, workers):
+        self.handler = handler
+        self.workers = workers
+        self.pending = {}
+        self.running = set()
+        self.ready = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def submit(self, item_id, event=None):
+        with self.lock:
+            self.start()
+            events = self.pending.setdefault(item_id, [])
+            events.append(event)
+            if len(events) == 1 and item_id not in self.running:
+                self.ready.put(item_id)
+
+    def start(self):
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.work, daemon=True,
+                                      name=f'bid-dispatch-{len(self.threads)}')
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        while True:
+            item_id = self.ready.get()
+            with self.lock:
+                events = self.pending.pop(item_id)
+                self.running.add(item_id)
+            try:
+                self.handler(item_id, events)
+            except Exception:
+                logger.exception('bid side effects failed for item %s', item_id)
+            finally:
+                close_old_connections()
+                with self.lock:
+                    self.running.discard(item_id)
+                    if item_id in self.pending:
+                        self.ready.put(item_id)
+                self.ready.task_done()
+
+    def join(self):
+        """
+        Blocks until every submitted event has been handled.
+        """
+        self.ready.join()
+
+
+def handle_item_events(item_id, events):
+    """
+    Bid side effects of one item, `events` being the bids saved since the
+    last batch (None for an AutoBid change). Watchers and the detail cache
+    are updated first, then the auto bids are evaluated once against the
+    item's current high bid, however many bids the batch holds, as of
+    the latest bid placed by hand (the auto bid changes as of now). The
+    item's stats are rolled up over the new bids last.
+    """
+    bids = [event for event in events if event is not None]
+    if bids:
+        bump_item_version(item_id)
+        for bid in bids:
+            publish_bid(bid)
+        bid_placed.send(sender=Bid, item_id=item_id, bids=bids)
+
+    placed = [bid.created_date for bid in bids
+              if not getattr(bid, 'by_autobid', False)]
+    if placed or len(bids) < len(events):
+        BidService().create_bid_by_auto(item_id, max(placed, default=None))
+    if bids:
+        StatsRollup().update(item_id)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> Dispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = Dispatcher(handle_item_events,
+                                         settings.BID_DISPATCH_WORKERS)
+    return _dispatcher
+
+
+def dispatch_on_commit(item_id, event=None, using=None):
+    """
+    Hands an item event to the workers once the current transaction
+    commits. With BID_DISPATCH_EAGER it is handled inline instead; its
+    errors are logged like in the workers, not raised, as the bid is
+    already committed and its request must not fail.
+    """
+    def dispatch():
+        if settings.BID_DISPATCH_EAGER:
+            try:
+                handle_item_events(item_id, [event])
+            except Exception:
+                logger.exception('bid side effects failed for item %s', item_id)
+        else:
+            get_dispatcher().submit(item_id, event)
+    transaction.on_commit(dispatch, using=using)
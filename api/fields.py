@@ -0,0 +1,83 @@
+import decimal
+from decimal import Decimal
+from django import forms
+from django.core import exceptions, validators
+from django.db import models
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+CENTS = 100
+
+
+def to_cents(value) -> int:
+    return int((Decimal(value) * CENTS).to_integral_value(decimal.ROUND_HALF_UP))
+
+
+def from_cents(cents) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def cents(name):
+    """
+    The MoneyField `name` as stored, whole cents as an int, for queries
+    that want to skip the Decimal conversion.
+    """
+    return models.ExpressionWrapper(models.F(name),
+                                    output_field=models.BigIntegerField())
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    An amount stored as a whole number of cents (BIGINT) and exposed as a
+    Decimal with two places. The database compares, indexes and sums
+    integers, models and the API keep working with Decimal.
+    """
+    description = _('Amount stored in cents')
+    default_error_messages = {
+        'invalid': _('“%(value)s” value must be a decimal number.'),
+    }
+    decimal_places = 2
+
+    def __init__(self, *args, max_digits=12, **kwargs):
+        self.max_digits = max_digits
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.max_digits != 12:
+            kwargs['max_digits'] = self.max_digits
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        return [*self.default_validators, *self._validators,
+                validators.DecimalValidator(self.max_digits, self.decimal_places)]
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            if isinstance(value, float):
+                value = str(value)
+            return Decimal(value)
+        except (decimal.InvalidOperation, TypeError, ValueError):
+            raise exceptions.ValidationError(
+                self.error_messages['invalid'], code='invalid',
+                params={'value': value})
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return to_cents(self.to_python(value))
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_cents(value)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            **kwargs,
+        })
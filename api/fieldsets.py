@@ -0,0 +1,136 @@
+from functools import partial
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+# internals
+from .metrics import serializer_timer
+
+# fields whose representation of a .values() column is the column itself
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField,
+                      serializers.BooleanField, serializers.ReadOnlyField,
+                      serializers.JSONField, PrimaryKeyRelatedField)
+
+
+def identity(value):
+    return value
+
+
+def requested_fields(request, names) -> list:
+    """
+    `names` narrowed by ?fields=a,b (only those) and ?omit=c (all but
+    those) of a safe request, in order. Unknown names are ignored.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return list(names)
+    only = request.query_params.get('fields')
+    omit = request.query_params.get('omit')
+    if only:
+        only = set(only.split(','))
+        names = [name for name in names if name in only]
+    if omit:
+        omit = set(omit.split(','))
+        names = [name for name in names if name not in omit]
+    return list(names)
+
+
+class SparseFieldsMixin(object):
+    """
+    Sparse fieldsets: a serializer of a safe request only has the fields
+    asked for with ?fields= / ?omit=. Writes always see every field.
+    """
+    sparse_fields = True
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.sparse_fields:
+            return fields
+        names = requested_fields(self.context.get('request'), fields)
+        return {name: fields[name] for name in names}
+
+
+class ValuesSerializerMixin(object):
+    """
+    Read-only serialization of `.values()` rows, with the same output as
+    to_representation of the instances. Only the fields whose
+    representation differs from the column (decimals, datetimes) go
+    through their serializer field. Nested and method fields can't be
+    projected, `fill_values` fills them in, or the serializer doesn't
+    support the values path.
+    """
+    # lookups fill_values needs besides the fields
+    values_extra = ()
+    # the fields fill_values fills in
+    values_filled = ()
+
+    def values_plan(self):
+        """
+        (name, lookup, convert) per readable field, lookup is None for
+        the fields left to fill_values.
+        """
+        plan = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if (isinstance(field, (serializers.BaseSerializer, ManyRelatedField,
+                                   serializers.SerializerMethodField))
+                    or field.source == '*'):
+                plan.append((name, None, None))
+                continue
+            if isinstance(field, serializers.DateTimeField):
+                # the current timezone, looked up once rather than per row
+                field.default_timezone = partial(identity, field.default_timezone())
+            convert = None if isinstance(field, PASSTHROUGH_FIELDS) else field.to_representation
+            plan.append((name, field.source.replace('.', '__'), convert))
+        return plan
+
+    def supports_values(self) -> bool:
+        return all(lookup is not None or name in self.values_filled
+                   for name, lookup, _ in self.values_plan())
+
+    def values_queryset(self, queryset):
+        """
+        The primary key and the ordering fields are always fetched,
+        pagination cursors are built from them.
+        """
+        meta = queryset.model._meta
+        lookups = [lookup for _, lookup, _ in self.values_plan() if lookup]
+        lookups += list(self.values_extra) + [meta.pk.attname] + [
+            meta.get_field(name.lstrip('-')).attname for name in meta.ordering]
+        return queryset.prefetch_related(None).values(*dict.fromkeys(lookups))
+
+    def values_data(self, rows) -> list:
+        rows = list(rows)
+        plan = self.values_plan()
+        with serializer_timer():
+            data = [{name: (None if lookup is None else
+                            row[lookup] if convert is None or row[lookup] is None else
+                            convert(row[lookup]))
+                     for name, lookup, convert in plan} for row in rows]
+            self.fill_values(rows, data)
+        return data
+
+    def fill_values(self, rows, data):
+        pass
+
+
+class ValuesListMixin(object):
+    """
+    List actions serialize .values() rows when API_VALUES_LISTS is on and
+    the serializer supports it, model instances otherwise.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        if not (settings.API_VALUES_LISTS and
+                isinstance(serializer, ValuesSerializerMixin) and
+                serializer.supports_values()):
+            return super().list(request, *args, **kwargs)
+
+        queryset = serializer.values_queryset(
+            self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.values_data(page))
+        return Response(serializer.values_data(queryset))
@@ -1,8 +1,8 @@
-from django.db.models import Q
 from django_filters.rest_framework import (
-    FilterSet, CharFilter, BooleanFilter)
+    FilterSet, CharFilter, BooleanFilter, NumberFilter, IsoDateTimeFilter)
 
-from .models import Item, AutoBid
+from .models import Item, AutoBid, Bid
+from .search import get_search_backend
 
 
 class ItemFilter(FilterSet):
@@ -16,10 +16,34 @@ class ItemFilter(FilterSet):
         fields = ['query']
 
     def query_by_multiple_fields(self, queryset, name, value):
-        q = Q(name__icontains=value) | Q(description__icontains=value)
-        return queryset.filter(q)
+        return get_search_backend(queryset.db).filter(queryset, value)
 
 class AutoBidFilter(FilterSet):
     class Meta:
         model = AutoBid
-        fields = ['made_by','item']
\ No newline at end of file
+        fields = ['made_by','item']
+
+
+class BidExportFilter(FilterSet):
+    item = NumberFilter(field_name='item_id')
+    made_by = NumberFilter(field_name='made_by_id')
+    since = IsoDateTimeFilter(field_name='created_date', lookup_expr='gte')
+    until = IsoDateTimeFilter(field_name='created_date', lookup_expr='lt')
+    closed = BooleanFilter(field_name='item__closed_at', lookup_expr='isnull',
+                           exclude=True, label='item closed')
+
+    class Meta:
+        model = Bid
+        fields = ['item', 'made_by', 'since', 'until', 'closed']
+
+
+class ItemExportFilter(FilterSet):
+    item = NumberFilter(field_name='id')
+    since = IsoDateTimeFilter(field_name='close_datetime', lookup_expr='gte')
+    until = IsoDateTimeFilter(field_name='close_datetime', lookup_expr='lt')
+    closed = BooleanFilter(field_name='closed_at', lookup_expr='isnull',
+                           exclude=True)
+
+    class Meta:
+        model = Item
+        fields = ['item', 'since', 'until', 'closed']
@@ -0,0 +1,132 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+IN_FLIGHT = 'in-flight'
+
+
+class IdempotencyStore(object):
+    """
+    Responses of requests made with an Idempotency-Key, kept in the cache
+    for `ttl` seconds as (fingerprint, status, data). A key being processed
+    holds a marker that expires after `lock_ttl`, should its request die.
+    """
+
+    def __init__(self, ttl, lock_ttl):
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+
+    def cache_key(self, client, path, key):
+        digest = hashlib.sha256(f'{client}:{path}:{key}'.encode()).hexdigest()
+        return f'idempotency:{digest}'
+
+    def begin(self, cache_key):
+        """
+        Claims the key; returns None when claimed, the stored entry (or
+        the in-flight marker) otherwise.
+        """
+        if cache.add(cache_key, IN_FLIGHT, self.lock_ttl):
+            return None
+        return cache.get(cache_key, IN_FLIGHT)
+
+    def stored(self, cache_key) -> bool:
+        """
+        Whether a response is stored for the key.
+        """
+        return cache.get(cache_key, IN_FLIGHT) != IN_FLIGHT
+
+    def finish(self, cache_key, fingerprint, response):
+        cache.set(cache_key, (fingerprint, response.status_code,
+                              response.data), self.ttl)
+
+    def release(self, cache_key):
+        cache.delete(cache_key)
+
+
+def fingerprint(data) -> str:
+    return hashlib.sha256(json.dumps(
+        data, cls=DjangoJSONEncoder, sort_keys=True).encode()).hexdigest()
+
+
+class IdempotentCreateMixin(object):
+    """
+    Honors the Idempotency-Key header on create: a retry with the same key
+    and payload gets the original response back (Idempotent-Replayed: true)
+    without running the view again, while the first one is still running
+    it gets a 409. Server errors are not stored, they can be retried.
+    Keys are per user, per client address for anonymous requests.
+    """
+    idempotency_header = 'Idempotency-Key'
+    idempotency_key_max_length = 255
+
+    def get_idempotency_store(self) -> IdempotencyStore:
+        return IdempotencyStore(settings.IDEMPOTENCY_KEY_TTL,
+                                settings.IDEMPOTENCY_LOCK_TTL)
+
+    def get_client_ident(self, request) -> str:
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return f'anon-{BaseThrottle().get_ident(request)}'
+
+    def check_throttles(self, request):
+        """
+        A retry whose response is stored is replayed without running the
+        view, it doesn't count against the throttles.
+        """
+        key = request.headers.get(self.idempotency_header)
+        if key and request.method not in SAFE_METHODS:
+            store = self.get_idempotency_store()
+            if store.stored(store.cache_key(
+                    self.get_client_ident(request), request.path, key)):
+                return
+        super().check_throttles(request)
+
+    def create(self, request, *args, **kwargs):
+        return self.idempotent(
+            request, lambda: super(IdempotentCreateMixin, self).create(
+                request, *args, **kwargs))
+
+    def idempotent(self, request, func):
+        key = request.headers.get(self.idempotency_header)
+        if not key:
+            return func()
+        if len(key) > self.idempotency_key_max_length:
+            return Response({'error': f'{self.idempotency_header} is too long.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        store = self.get_idempotency_store()
+        cache_key = store.cache_key(self.get_client_ident(request), request.path, key)
+        payload = fingerprint(request.data)
+        entry = store.begin(cache_key)
+        if entry == IN_FLIGHT:
+            return Response({'error': 'A request with this key is in progress.'},
+                            status=status.HTTP_409_CONFLICT)
+        if entry is not None:
+            stored_payload, status_code, data = entry
+            if stored_payload != payload:
+                return Response({'error': f'{self.idempotency_header} was used '
+                                          'with a different payload.'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return Response(data, status=status_code,
+                            headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = func()
+        except APIException as exc:
+            # a rejected request is replayed as well, not validated again
+            response = self.handle_exception(exc)
+        except Exception:
+            store.release(cache_key)
+            raise
+        if response.status_code >= 500:
+            store.release(cache_key)
+        else:
+            store.finish(cache_key, payload, response)
+        return response
@@ -0,0 +1,199 @@
+import hashlib
+import io
+import logging
+import os
+import posixpath
+import threading
+import uuid
+from concurrent import futures
+from functools import partial
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image as PILImage, ImageOps
+# internals
+from .cache import invalidate_item
+from .models import Image
+
+logger = logging.getLogger(__name__)
+
+# format name: (Pillow format, content type)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+
+def render_variants(source, target_dir, widths, formats, quality) -> dict:
+    """
+    Resizes the image file `source` to each of `widths` narrower than it
+    (its own width if none is) in each of `formats`, into `target_dir`.
+    Runs in the worker processes, so it doesn't touch Django. Files are
+    named after the source's content hash and never change, a CDN can
+    cache them forever.
+    """
+    with open(source, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    with PILImage.open(io.BytesIO(data)) as opened:
+        original = ImageOps.exif_transpose(opened)
+    if original.mode not in ('RGB', 'RGBA'):
+        alpha = 'A' in original.mode or 'transparency' in original.info
+        original = original.convert('RGBA' if alpha else 'RGB')
+    width, height = original.size
+
+    os.makedirs(target_dir, exist_ok=True)
+    variants = []
+    for target in [w for w in widths if w < width] or [width]:
+        size = (target, max(round(height * target / width), 1))
+        resized = (original if size == original.size
+                   else original.resize(size, PILImage.LANCZOS))
+        for name in formats:
+            image = resized
+            if name == 'jpeg' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            filename = f'{digest}-{size[0]}w.{name}'
+            image.save(os.path.join(target_dir, filename), FORMATS[name][0],
+                       quality=quality)
+            variants.append({'format': name, 'width': size[0],
+                             'height': size[1], 'file': filename})
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+def variant_dir(path):
+    return posixpath.join(posixpath.dirname(path), 'variants')
+
+
+def render_args(image) -> tuple:
+    """
+    `render_variants` arguments for an image of the (file system) default
+    storage.
+    """
+    return (default_storage.path(image.path),
+            default_storage.path(variant_dir(image.path)),
+            settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_VARIANT_FORMATS,
+            settings.IMAGE_VARIANT_QUALITY)
+
+
+def rendered(image, result):
+    """
+    Sets the outcome of `render_variants` on the image, variant files as
+    storage paths.
+    """
+    directory = variant_dir(image.path)
+    image.width = result['width']
+    image.height = result['height']
+    image.variants = [
+        {'format': variant['format'], 'width': variant['width'],
+         'height': variant['height'],
+         'path': posixpath.join(directory, variant['file'])}
+        for variant in result['variants']]
+    return image
+
+
+def store_variants(image, result):
+    """
+    UPDATE, not save(), so storing doesn't render the image once more.
+    """
+    rendered(image, result)
+    Image.objects.filter(pk=image.pk, path=image.path).update(
+        width=image.width, height=image.height, variants=image.variants)
+    invalidate_item(image.item_id)
+
+
+def is_stored(path) -> bool:
+    try:
+        return bool(path) and default_storage.exists(path)
+    except SuspiciousFileOperation:
+        return False
+
+
+def save_upload(item_id, upload) -> str:
+    extension = os.path.splitext(upload.name)[1].lower()
+    return default_storage.save(
+        f'images/{item_id}/{uuid.uuid4().hex}{extension}', upload)
+
+
+def sources(variants) -> list:
+    """
+    An image's variants as <picture> sources, one per format in the
+    order of IMAGE_VARIANT_FORMATS, each with a `srcset` of its widths.
+    """
+    by_format = {}
+    for variant in variants or ():
+        by_format.setdefault(variant['format'], []).append(variant)
+    return [
+        {'type': FORMATS[name][1],
+         'srcset': ', '.join(
+             f'{default_storage.url(variant["path"])} {variant["width"]}w'
+             for variant in sorted(by_format[name], key=lambda v: v['width']))}
+        for name in settings.IMAGE_VARIANT_FORMATS if name in by_format]
+
+
+class ImagePipeline(object):
+    """
+    Renders variants in a pool of worker processes, Pillow being CPU
+    bound. Results are stored from the pool's callback thread.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+        self.pending = 0
+        self.lock = threading.Condition()
+
+    def submit(self, image):
+        with self.lock:
+            if self.pool is None:
+                self.pool = futures.ProcessPoolExecutor(self.workers)
+            future = self.pool.submit(render_variants, *render_args(image))
+            self.pending += 1
+        future.add_done_callback(partial(self.done, image))
+
+    def done(self, image, future):
+        try:
+            store_variants(image, future.result())
+        except Exception:
+            logger.exception('rendering variants of image %s failed', image.pk)
+        finally:
+            close_old_connections()
+            with self.lock:
+                self.pending -= 1
+                self.lock.notify_all()
+
+    def join(self):
+        """
+        Blocks until every submitted image has been rendered and stored.
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: not self.pending)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_image_pipeline() -> ImagePipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = ImagePipeline(settings.IMAGE_VARIANT_WORKERS)
+    return _pipeline
+
+
+def render_on_commit(image, using=None):
+    """
+    Renders the variants of an uploaded image once the current transaction
+    commits. With IMAGE_VARIANT_EAGER it is done inline instead. Paths
+    that aren't files of the storage (e.g. external URLs) are left alone.
+    """
+    def render():
+        if not is_stored(image.path):
+            return
+        if settings.IMAGE_VARIANT_EAGER:
+            store_variants(image, render_variants(*render_args(image)))
+        else:
+            get_image_pipeline().submit(image)
+    transaction.on_commit(render, using=using)
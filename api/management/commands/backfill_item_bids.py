@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+# internals
+from api.models import Item, Bid
+
+
+class Command(BaseCommand):
+    help = ('Recomputes current_bid_value, current_bidder and bid_count '
+            'of every item from its bids.')
+
+    fields = ('current_bid_value', 'current_bidder', 'bid_count')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        top_bid = Bid.objects.filter(
+            item=OuterRef('pk')).order_by('-value', '-created_date')
+        items = Item.objects.order_by('pk').only('pk').annotate(
+            top_value=Subquery(top_bid.values('value')[:1]),
+            top_bidder=Subquery(top_bid.values('made_by')[:1]),
+            total=Count('bids'))
+
+        updated = 0
+        batch = []
+        for item in items.iterator(chunk_size=batch_size):
+            item.current_bid_value = item.top_value
+            item.current_bidder_id = item.top_bidder
+            item.bid_count = item.total
+            batch.append(item)
+            if len(batch) == batch_size:
+                updated += self.flush(batch)
+        updated += self.flush(batch)
+        self.stdout.write(self.style.SUCCESS(f'{updated} items backfilled'))
+
+    def flush(self, batch):
+        with transaction.atomic():
+            Item.objects.bulk_update(batch, self.fields)
+        count = len(batch)
+        batch.clear()
+        return count
@@ -0,0 +1,297 @@
+import datetime
+import itertools
+import json
+import logging
+import platform
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+# internals
+from api.dispatch import get_dispatcher
+from api.management.commands.bench_search import vocabulary, words
+from api.models import AutoBid, Bid, Item
+from api.search import get_search_backend
+
+SCENARIOS = ('item_list', 'item_detail', 'search', 'bid_contention',
+             'autobid_war')
+
+
+class Command(BaseCommand):
+    help = ('Seeds synthetic users, items, bids and auto bids into the '
+            'configured database, then measures throughput and p50/p99 '
+            'latency of the hot paths through the full middleware stack. '
+            'Results are written as JSON, comparable between commits with '
+            '--baseline. The seeded rows are deleted afterwards unless '
+            '--keep is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--bids-per-item', type=int, default=5)
+        parser.add_argument('--autobids-per-item', type=int, default=2)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests per scenario')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='concurrent bidders on the hot item')
+        parser.add_argument('--war-proxies', type=int, default=50,
+                            help='auto bids competing in each war')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='run only these (repeatable)')
+        parser.add_argument('--output', help='write the JSON results here')
+        parser.add_argument('--baseline', help='JSON results to compare with')
+        parser.add_argument('--keep', action='store_true')
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.options = options
+        started = timezone.now()
+        # outbid bids are expected, don't log each 400
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        self.seed()
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                results = {name: getattr(self, name)()
+                           for name in options['scenario'] or SCENARIOS}
+        finally:
+            get_dispatcher().join()
+            if not options['keep']:
+                self.cleanup()
+
+        report = {
+            'meta': {
+                'started': started.isoformat(),
+                'vendor': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                **{key: options[key] for key in (
+                    'items', 'users', 'bids_per_item', 'autobids_per_item',
+                    'requests', 'threads', 'war_proxies', 'seed')},
+            },
+            'scenarios': results,
+        }
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:16} {result["throughput"]:9.1f} req/s  '
+                f'p50 {result["p50_ms"]:8.2f} ms  p99 {result["p99_ms"]:8.2f} ms  '
+                f'errors {result["errors"]}')
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    # data
+
+    def seed(self):
+        """
+        Bulk inserts everything, with the items' current bid fields filled
+        in from the generated bids, and rebuilds the search index.
+        """
+        options = self.options
+        if options['users'] < options['bids_per_item'] + options['autobids_per_item']:
+            raise CommandError('--users must cover the bids and auto bids of an item')
+        rnd, vocab = self.rnd, vocabulary()
+        prefix = f'bench-{int(time.time())}-'
+        self.users = User.objects.bulk_create(
+            User(username=f'{prefix}{i}', password='!')
+            for i in range(options['users'] + options['war_proxies']))
+        if self.users[0].pk is None:
+            self.users = list(User.objects.filter(
+                username__startswith=prefix).order_by('pk'))
+        bidders = self.users[:options['users']]
+
+        close = timezone.now() + datetime.timedelta(days=30)
+        items, ladders = [], []
+        for _ in range(options['items']):
+            ladder = [(user, Decimal(10 + step * 5))
+                      for step, user in enumerate(rnd.sample(
+                          bidders, options['bids_per_item']))]
+            items.append(Item(
+                name=words(rnd, vocab, 3), description=words(rnd, vocab, 30),
+                close_datetime=close, bid_count=len(ladder),
+                current_bid_value=ladder[-1][1] if ladder else None,
+                current_bidder=ladder[-1][0] if ladder else None))
+            ladders.append(ladder)
+        # one hot item for the contention, one fresh item per war
+        items += [Item(name='hot', description='hot', close_datetime=close)
+                  for _ in range(options['requests'] + 1)]
+        with transaction.atomic():
+            Item.objects.bulk_create(items, batch_size=1000)
+        if items[0].pk is None:
+            items = list(Item.objects.order_by('-pk')[:len(items)])[::-1]
+        self.items = items[:options['items']]
+        self.hot_item = items[options['items']]
+        self.war_items = items[options['items'] + 1:]
+
+        bids, autobids = [], []
+        for item, ladder in zip(self.items, ladders):
+            bids += [Bid(item=item, made_by=user, value=value)
+                     for user, value in ladder]
+            taken = {user.pk for user, _ in ladder}
+            proxies = [user for user in bidders if user.pk not in taken]
+            autobids += [AutoBid(item=item, made_by=user,
+                                 max_bid_value=Decimal(rnd.randint(50, 500)))
+                         for user in rnd.sample(proxies, options['autobids_per_item'])]
+        for item in self.war_items:
+            autobids += [AutoBid(item=item, made_by=user,
+                                 max_bid_value=Decimal(rnd.randint(1000, 100000)))
+                         for user in self.users[options['users']:]]
+        with transaction.atomic():
+            Bid.objects.bulk_create(bids, batch_size=1000)
+            AutoBid.objects.bulk_create(autobids, batch_size=1000)
+        get_search_backend().rebuild()
+
+    def cleanup(self):
+        item_ids = [item.pk for item in
+                    self.items + [self.hot_item] + self.war_items]
+        with transaction.atomic():
+            for start in range(0, len(item_ids), 500):
+                batch = item_ids[start:start + 500]
+                Bid.objects.filter(item_id__in=batch).delete()
+                AutoBid.objects.filter(item_id__in=batch).delete()
+                Item.objects.filter(pk__in=batch).delete()
+            User.objects.filter(pk__in=[user.pk for user in self.users]).delete()
+
+    # scenarios
+
+    def client(self):
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        return client
+
+    def measure(self, requests, threads=1):
+        """
+        Runs `requests[i](client)` over `threads` threads, each with its own
+        client and connection. A response is an error when it is not 2xx,
+        or 400 for scenarios that expect bids to be outbid.
+        """
+        timings, errors, lock = [], [], threading.Lock()
+        work = iter(requests)
+
+        def run():
+            client = self.client()
+            try:
+                while True:
+                    with lock:
+                        request = next(work, None)
+                    if request is None:
+                        return
+                    start = time.perf_counter()
+                    ok = request(client)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        timings.append(elapsed)
+                        if not ok:
+                            errors.append(elapsed)
+            finally:
+                if threads > 1:
+                    close_old_connections()
+
+        start = time.perf_counter()
+        if threads == 1:
+            run()
+        else:
+            workers = [threading.Thread(target=run) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        wall = time.perf_counter() - start
+        timings.sort()
+        return {
+            'requests': len(timings),
+            'errors': len(errors),
+            'throughput': len(timings) / wall,
+            'mean_ms': statistics.mean(timings),
+            'p50_ms': statistics.median(timings),
+            'p99_ms': timings[max(int(len(timings) * 0.99) - 1, 0)],
+        }
+
+    def item_list(self):
+        url = reverse('api:items-list')
+        pages = max(len(self.items) // 10, 1)
+        return self.measure(
+            lambda client, page=self.rnd.randint(1, pages):
+                client.get(url, {'page': page}).status_code == 200
+            for _ in range(self.options['requests']))
+
+    def item_detail(self):
+        return self.measure(
+            lambda client, item=self.rnd.choice(self.items):
+                client.get(reverse('api:items-detail', args=[item.pk])).status_code == 200
+            for _ in range(self.options['requests']))
+
+    def search(self):
+        url = reverse('api:items-list')
+        vocab = vocabulary()
+        return self.measure(
+            lambda client, query=' '.join(self.rnd.sample(vocab[100:5000], 1)):
+                client.get(url, {'query': query}).status_code == 200
+            for _ in range(self.options['requests']))
+
+    def bid_contention(self):
+        """
+        Every thread bids on the hot item at the next value; a bid that
+        lost the race is rejected (400), only other responses are errors.
+        """
+        url = reverse('api:bids-list')
+        values = itertools.count(100)
+        bidders = self.users[:self.options['users']]
+
+        def bid(client, made_by):
+            response = client.post(url, {'item': self.hot_item.pk,
+                                         'made_by': made_by.pk,
+                                         'value': next(values)})
+            return response.status_code in (201, 400)
+        return self.measure(
+            [lambda client, made_by=bidders[i % len(bidders)]: bid(client, made_by)
+             for i in range(self.options['requests'])],
+            threads=self.options['threads'])
+
+    def autobid_war(self):
+        """
+        Each request opens the bidding on its own item where the auto bids
+        of --war-proxies users compete. They answer inside the request
+        (eager dispatch), so the latency includes resolving the war.
+        """
+        url = reverse('api:bids-list')
+        bidder = self.users[0]
+
+        def bid(client, item):
+            response = client.post(url, {'item': item.pk, 'made_by': bidder.pk,
+                                         'value': 100})
+            return response.status_code == 201
+        with override_settings(BID_DISPATCH_EAGER=True):
+            return self.measure(
+                lambda client, item=item: bid(client, item)
+                for item in self.war_items)
+
+    def compare(self, results, path):
+        with open(path) as f:
+            baseline = json.load(f)['scenarios']
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            self.stdout.write(
+                f'{name:16} throughput {self.change(before["throughput"], result["throughput"])}  '
+                f'p50 {self.change(before["p50_ms"], result["p50_ms"])}  '
+                f'p99 {self.change(before["p99_ms"], result["p99_ms"])}')
+
+    @staticmethod
+    def change(before, after):
+        return f'{(after - before) / before * 100:+7.1f}%' if before else '    n/a'
@@ -0,0 +1,52 @@
+import datetime
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+# internals
+from api.authentication import CachedJWTAuthentication, get_user_cache
+from api.models import Item
+from api.views import ItemViewSet
+
+
+class Command(BaseCommand):
+    help = ('Requests/sec of a token-authenticated item detail (served from '
+            'the detail cache) with JWTAuthentication and with '
+            'CachedJWTAuthentication. Runs on the configured database inside '
+            'a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.bench(options['requests'])
+            transaction.set_rollback(True)
+
+    def bench(self, requests):
+        user = User.objects.create_user('bench-auth')
+        item = Item.objects.create(
+            name='bench', description='bench',
+            close_datetime=timezone.now() + datetime.timedelta(days=1))
+        request = APIRequestFactory().get(
+            f'/api/v1/items/{item.id}/',
+            HTTP_AUTHORIZATION=f'Token {AccessToken.for_user(user)}')
+        get_user_cache().clear()
+
+        for authentication in (JWTAuthentication, CachedJWTAuthentication):
+            view = ItemViewSet.as_view(
+                {'get': 'retrieve'}, authentication_classes=[authentication])
+            view(request, pk=item.id).render()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(requests):
+                    view(request, pk=item.id).render()
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{authentication.__name__:24} {requests / elapsed:9.0f} req/s  '
+                f'{len(queries) / requests:.1f} queries/request')
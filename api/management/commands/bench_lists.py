@@ -0,0 +1,72 @@
+import datetime
+import decimal
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+# internals
+from api.models import AutoBid, Bid, Image, Item
+from api.renderers import FastJSONRenderer, orjson
+from api.views import AutoBidViewSet, BidViewSet, ItemViewSet
+
+
+class Command(BaseCommand):
+    help = ('Milliseconds per 1,000-row list page of items (?noPage), bids '
+            'and autobids, serialized from model instances and from '
+            '.values() rows, rendered with JSONRenderer and FastJSONRenderer. '
+            'Runs on the configured database inside a transaction that is '
+            'rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.bench(options['rows'], options['requests'])
+            transaction.set_rollback(True)
+
+    def bench(self, rows, requests):
+        self.stdout.write(f'orjson: {"yes" if orjson else "no, stdlib fallback"}')
+        users = [User.objects.create_user(f'bench-lists-{i}') for i in range(rows)]
+        close = timezone.now() + datetime.timedelta(days=1)
+        item = Item.objects.create(name='bench', description='bench', close_datetime=close)
+        Item.objects.bulk_create(
+            Item(name=f'bench {i}', description='bench ' * 20,
+                 price=decimal.Decimal('10'), close_datetime=close)
+            for i in range(rows))
+        # bulk_create doesn't set the primary keys on every database
+        items = list(Item.objects.filter(name__startswith='bench ').order_by('id'))
+        Image.objects.bulk_create(Image(item=item, path=f'bench/{item.id}.png')
+                                  for item in items)
+        Bid.objects.bulk_create(
+            Bid(item=item, made_by=users[i], value=decimal.Decimal(11 + i))
+            for i in range(rows))
+        AutoBid.objects.bulk_create(
+            AutoBid(item=items[i], made_by=users[i], max_bid_value=decimal.Decimal('100'))
+            for i in range(rows))
+
+        factory = APIRequestFactory()
+        lists = (
+            ('items', ItemViewSet, factory.get('/api/v1/items/', {'noPage': ''})),
+            ('bids', BidViewSet, factory.get('/api/v1/bids/')),
+            ('autobids', AutoBidViewSet, factory.get('/api/v1/autobids/')),
+        )
+        for name, viewset, request in lists:
+            for values_lists in (False, True):
+                for renderer in (JSONRenderer, FastJSONRenderer):
+                    view = viewset.as_view({'get': 'list'}, renderer_classes=[renderer])
+                    with override_settings(API_VALUES_LISTS=values_lists):
+                        view(request).render()
+                        start = time.perf_counter()
+                        for _ in range(requests):
+                            response = view(request).render()
+                        elapsed = time.perf_counter() - start
+                    self.stdout.write(
+                        f'{name:9} {"values" if values_lists else "instances":10}'
+                        f'{renderer.__name__:17} {elapsed / requests * 1000:8.1f} ms/page  '
+                        f'{len(response.content) // 1024:5} KiB')
@@ -0,0 +1,77 @@
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+# internals
+from api.models import AutoBid, Item
+from api.orderbook import OrderBooks, load_ceilings
+from api.services import BidService
+
+
+class Command(BaseCommand):
+    help = ('Compares resolving proxy bids from the in-memory order book '
+            'with reading every active AutoBid of the item. Runs on the '
+            'configured database inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proxies', type=int, default=10000)
+        parser.add_argument('--rounds', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.bench(options['proxies'], options['rounds'])
+            transaction.set_rollback(True)
+
+    def bench(self, proxies, rounds):
+        rnd = random.Random(0)
+        item = Item.objects.create(
+            name='bench', description='bench',
+            close_datetime=timezone.now() + datetime.timedelta(days=1))
+        users = User.objects.bulk_create(
+            User(username=f'bench-orderbook-{i}') for i in range(proxies))
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith='bench-orderbook-'))
+        AutoBid.objects.bulk_create(
+            AutoBid(item=item, made_by=user, is_active=True,
+                    max_bid_value=Decimal(rnd.randint(100, 100000)))
+            for user in users)
+
+        service = BidService()
+        books = OrderBooks(max_items=1, ttl=3600)
+        start = time.perf_counter()
+        books.get(item.id)
+        self.stdout.write(f'{proxies} proxies, book loaded in '
+                          f'{(time.perf_counter() - start) * 1000:.2f} ms')
+
+        incoming = [(Decimal(rnd.randint(1, 99999)), rnd.choice(users).id)
+                    for _ in range(rounds)]
+        paths = (
+            ('database', lambda made_by_id: load_ceilings(AutoBid.objects.filter(
+                item=item, is_active=True))),
+            ('order book', lambda made_by_id: books.candidates(
+                item.id, made_by_id)),
+        )
+        outcomes = {}
+        for name, autobids in paths:
+            timings = []
+            outcomes[name] = []
+            for value, made_by_id in incoming:
+                start = time.perf_counter()
+                resolution = service.resolve_auto_bids(
+                    value, made_by_id, autobids(made_by_id))
+                timings.append((time.perf_counter() - start) * 1000)
+                outcomes[name].append(resolution.bids)
+            timings.sort()
+            self.stdout.write(
+                f'{name:12} p50 {statistics.median(timings):9.3f} ms  '
+                f'p99 {timings[int(len(timings) * 0.99) - 1]:9.3f} ms')
+
+        if outcomes['database'] != outcomes['order book']:
+            self.stderr.write('order book resolutions differ from the database')
+        if not books.verify(item.id):
+            self.stderr.write('order book differs from the database')
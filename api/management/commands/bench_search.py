@@ -0,0 +1,85 @@
+import functools
+import itertools
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+# internals
+from api.models import Item
+from api.search import LikeSearchBackend, get_search_backend
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vi', 'zo', 'pe', 'sa',
+             'do', 'fi', 'gu', 'ha', 'je', 'ko', 'li', 'mu', 'no', 'ri')
+
+
+def vocabulary(size=20000):
+    rnd = random.Random(7)
+    vocab = list({''.join(rnd.choices(SYLLABLES, k=rnd.randint(3, 5)))
+                  for _ in range(size)})
+    rnd.shuffle(vocab)
+    return vocab
+
+
+def words(rnd, vocab, k):
+    """
+    Zipf draw: a few words are everywhere, most are rare.
+    """
+    weights = _zipf_weights(len(vocab))
+    return ' '.join(rnd.choices(vocab, cum_weights=weights, k=k))
+
+
+@functools.lru_cache()
+def _zipf_weights(size):
+    return list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Compares the full-text item search with the old icontains '
+            'filter. With --seed, first inserts synthetic items into the '
+            'configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='number of synthetic items to insert, '
+                                 'e.g. 1000000')
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['batch_size'])
+            get_search_backend().rebuild()
+
+        total = Item.objects.count()
+        rnd = random.Random(42)
+        vocab = vocabulary()
+        # what users type: specific terms, not the most common words
+        queries = [' '.join(rnd.sample(vocab[100:5000], rnd.randint(1, 2)))
+                   for _ in range(options['queries'])]
+        self.stdout.write(f'{total} items, {len(queries)} queries, '
+                          f'count and first page of 10 like the item list')
+
+        for backend in (LikeSearchBackend(None), get_search_backend()):
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                queryset = backend.filter(Item.objects.all(), query)
+                queryset.count()
+                list(queryset[:10])
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{backend.__class__.__name__:24} '
+                f'p50 {statistics.median(timings):9.2f} ms  '
+                f'p99 {timings[int(len(timings) * 0.99) - 1]:9.2f} ms')
+
+    def seed(self, count, batch_size):
+        rnd = random.Random(0)
+        vocab = vocabulary()
+        for start in range(0, count, batch_size):
+            batch = [Item(name=words(rnd, vocab, 3),
+                          description=words(rnd, vocab, 30))
+                     for _ in range(min(batch_size, count - start))]
+            with transaction.atomic():
+                Item.objects.bulk_create(batch)
@@ -0,0 +1,34 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+# internals
+from api.scheduler import CloseScheduler
+
+
+class Command(BaseCommand):
+    help = ('Closes auctions as their close_datetime passes: settles the '
+            'winner and final price, deactivates their auto bids and '
+            'publishes the close events. Runs until stopped, or once with '
+            '--once (e.g. from cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='close the items already due and exit')
+        parser.add_argument('--database', default=None)
+        parser.add_argument('--batch-size', type=int,
+                            default=CloseScheduler.batch_size)
+        parser.add_argument('--horizon', type=int,
+                            default=int(CloseScheduler.horizon.total_seconds()),
+                            help='seconds ahead the timer heap is loaded')
+
+    def handle(self, *args, **options):
+        scheduler = CloseScheduler(using=options['database'])
+        scheduler.batch_size = options['batch_size']
+        scheduler.horizon = timedelta(seconds=options['horizon'])
+        if options['once']:
+            closed = scheduler.run_once()
+            self.stdout.write(self.style.SUCCESS(f'{closed} auctions closed'))
+            return
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            pass
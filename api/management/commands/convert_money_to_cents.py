@@ -0,0 +1,65 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, models
+# internals
+from api.fields import CENTS, MoneyField
+
+
+class Command(BaseCommand):
+    help = ('Converts the amount columns of a database created when they '
+            'were DECIMAL(12, 2) to whole cents in BIGINT, values included. '
+            'Columns already in cents are left alone, so it can be run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'{connection.vendor} is not supported')
+        fields = [(model, field)
+                  for model in apps.get_app_config('api').get_models()
+                  for field in model._meta.local_concrete_fields
+                  if isinstance(field, MoneyField)]
+
+        converted = 0
+        with connection.schema_editor() as schema_editor:
+            for model, field in fields:
+                if self.column_type(connection, model, field) != 'DecimalField':
+                    continue
+                self.convert(schema_editor, model, field)
+                converted += 1
+                self.stdout.write(f'{model._meta.db_table}.{field.column}')
+        self.stdout.write(self.style.SUCCESS(f'{converted} columns converted'))
+
+    def column_type(self, connection, model, field):
+        with connection.cursor() as cursor:
+            description = connection.introspection.get_table_description(
+                cursor, model._meta.db_table)
+        for column in description:
+            if column.name == field.column:
+                return connection.introspection.get_field_type(
+                    column.type_code, column)
+        raise CommandError(f'{model._meta.db_table}.{field.column} is missing')
+
+    def convert(self, schema_editor, model, field):
+        """
+        PostgreSQL scales while changing the type. SQLite scales in place,
+        then the table is rebuilt with the BIGINT column.
+        """
+        quote = schema_editor.quote_name
+        table, column = quote(model._meta.db_table), quote(field.column)
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(
+                f'ALTER TABLE {table} ALTER COLUMN {column} TYPE bigint '
+                f'USING round({column} * {CENTS})::bigint')
+            return
+        schema_editor.execute(
+            f'UPDATE {table} SET {column} = '
+            f'CAST(round({column} * {CENTS}) AS integer)')
+        decimal = models.DecimalField(max_digits=field.max_digits,
+                                      decimal_places=field.decimal_places,
+                                      null=field.null)
+        decimal.set_attributes_from_name(field.name)
+        decimal.model = model
+        schema_editor.alter_field(model, decimal, field)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+# internals
+from api.export import BID_COLUMNS, FORMATS, ITEM_COLUMNS, export_lines
+from api.filters import BidExportFilter, ItemExportFilter
+from api.models import Bid, Item
+
+EXPORTS = {
+    'bids': (Bid, BidExportFilter, BID_COLUMNS),
+    'items': (Item, ItemExportFilter, ITEM_COLUMNS),
+}
+
+
+class Command(BaseCommand):
+    help = ('Streams bids or items as CSV or NDJSON to a file or stdout, '
+            'with the filters of the /export/ endpoints.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('what', choices=EXPORTS)
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='file to write, stdout otherwise')
+        parser.add_argument('--item', type=int)
+        parser.add_argument('--made-by', type=int, help='bids only')
+        parser.add_argument('--since', help='ISO 8601 date/time, inclusive')
+        parser.add_argument('--until', help='ISO 8601 date/time, exclusive')
+        parser.add_argument('--closed', action='store_true',
+                            help='closed auctions only')
+        parser.add_argument('--database', default=None)
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        model, filterset_class, columns = EXPORTS[options['what']]
+        data = {name: options[option] for name, option in (
+            ('item', 'item'), ('made_by', 'made_by'), ('since', 'since'),
+            ('until', 'until')) if options[option] is not None}
+        if options['closed']:
+            data['closed'] = 'true'
+        filterset = filterset_class(
+            data, queryset=model.objects.using(options['database']).order_by('id'))
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+
+        lines = export_lines(filterset.qs, columns, options['format'],
+                             options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
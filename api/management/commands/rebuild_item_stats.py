@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+# internals
+from api.models import Bid
+from api.stats import StatsRollup
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the stats rollup of the items with bids (or of --item) '
+            'from their whole bid history, e.g. after bids were deleted or '
+            'ITEM_STATS_BUCKET_SECONDS changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item', type=int, action='append',
+                            help='only this item (repeatable)')
+
+    def handle(self, *args, **options):
+        item_ids = options['item'] or list(
+            Bid.objects.order_by('item_id').values_list(
+                'item_id', flat=True).distinct())
+        rollup = StatsRollup()
+        for item_id in item_ids:
+            rollup.rebuild(item_id)
+        self.stdout.write(self.style.SUCCESS(f'{len(item_ids)} items rebuilt'))
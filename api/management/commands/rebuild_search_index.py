@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+# internals
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = ('Creates the item search index (FTS5 table on SQLite, GIN index '
+            'on Postgres) and fills it from existing items.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{backend.__class__.__name__} index rebuilt'))
@@ -0,0 +1,60 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import transaction
+# internals
+from api.cache import invalidate_item
+from api.imaging import is_stored, render_args, render_variants, rendered
+from api.models import Image
+
+
+def render(args):
+    try:
+        return render_variants(*args), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+class Command(BaseCommand):
+    help = ('Renders the variants of the stored images that have none yet '
+            '(all of them with --all) in a pool of worker processes.')
+
+    fields = ('width', 'height', 'variants')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='render the images with variants again')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        images = Image.objects.order_by('pk')
+        if not options['all']:
+            images = images.filter(width__isnull=True)
+        images = [image for image in images.iterator() if is_stored(image.path)]
+
+        rendered_count, failed = 0, 0
+        batch = []
+        with ProcessPoolExecutor(options['workers']) as pool:
+            results = pool.map(render, [render_args(image) for image in images],
+                               chunksize=4)
+            for image, (result, error) in zip(images, results):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'image {image.pk} ({image.path}): {error}')
+                    continue
+                batch.append(rendered(image, result))
+                if len(batch) == options['batch_size']:
+                    rendered_count += self.flush(batch)
+        rendered_count += self.flush(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'{rendered_count} images rendered, {failed} failed'))
+
+    def flush(self, batch):
+        with transaction.atomic():
+            Image.objects.bulk_update(batch, self.fields)
+            for item_id in {image.item_id for image in batch}:
+                invalidate_item(item_id)
+        count = len(batch)
+        batch.clear()
+        return count
@@ -0,0 +1,301 @@
+import contextlib
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.fields import empty
+from rest_framework.permissions import BasePermission
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = ContextVar('metrics_request', default=None)
+
+
+class RequestMetrics(object):
+    """
+    What one request spent, filled in by the connection execute wrapper
+    and the serializers. SQL is only kept when slow requests are sampled.
+    """
+    max_statements = 200
+
+    def __init__(self, record_sql=False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.statements = [] if record_sql else None
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if (self.statements is not None and
+                    len(self.statements) < self.max_statements):
+                self.statements.append((sql, elapsed))
+
+
+class ViewStats(object):
+    def __init__(self):
+        self.statuses = Counter()
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+    def observe(self, status, duration, request_metrics):
+        self.statuses[status] += 1
+        for index, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+                break
+        self.count += 1
+        self.duration += duration
+        self.queries += request_metrics.queries
+        self.db_time += request_metrics.db_time
+        self.serializer_time += request_metrics.serializer_time
+
+
+class MetricsRegistry(object):
+    """
+    Per (view, method) stats of this process and a ring buffer of the
+    slowest-to-answer requests with their SQL. Each worker process keeps
+    its own, scrape them per worker.
+    """
+
+    def __init__(self, slow_buffer):
+        self.stats = {}
+        self.slow = deque(maxlen=slow_buffer)
+        self.lock = threading.Lock()
+
+    def observe(self, view, method, status, duration, request_metrics):
+        with self.lock:
+            stats = self.stats.get((view, method))
+            if stats is None:
+                stats = self.stats[(view, method)] = ViewStats()
+            stats.observe(status, duration, request_metrics)
+
+    def sample(self, path, view, method, status, duration, request_metrics):
+        self.slow.append({
+            'path': path, 'view': view, 'method': method, 'status': status,
+            'duration': duration, 'queries': request_metrics.queries,
+            'db_time': request_metrics.db_time,
+            'serializer_time': request_metrics.serializer_time,
+            'sql': [{'sql': sql, 'time': elapsed}
+                    for sql, elapsed in request_metrics.statements or ()],
+        })
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.slow.clear()
+
+    def render(self) -> str:
+        with self.lock:
+            stats = sorted((key, self._copy(value))
+                           for key, value in self.stats.items())
+        lines = [
+            '# HELP http_requests_total Requests by view, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (view, method), view_stats in stats:
+            for status, count in sorted(view_stats.statuses.items()):
+                lines.append(f'http_requests_total{{{_labels(view, method)},'
+                             f'status="{status}"}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Request latency.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (view, method), view_stats in stats:
+            labels = _labels(view, method)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, view_stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},'
+                             f'le="{bound}"}} {cumulative}')
+            lines += [
+                f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+                f'{view_stats.count}',
+                f'http_request_duration_seconds_sum{{{labels}}} {view_stats.duration}',
+                f'http_request_duration_seconds_count{{{labels}}} {view_stats.count}',
+            ]
+
+        for name, attr, kind, help_text in (
+                ('http_request_db_queries_total', 'queries', 'counter',
+                 'Database queries run by requests.'),
+                ('http_request_db_seconds_total', 'db_time', 'counter',
+                 'Time requests spent in the database.'),
+                ('http_request_serializer_seconds_total', 'serializer_time',
+                 'counter', 'Time requests spent in serializers.')):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for (view, method), view_stats in stats:
+                lines.append(f'{name}{{{_labels(view, method)}}} '
+                             f'{getattr(view_stats, attr)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _copy(view_stats):
+        copy = ViewStats()
+        copy.__dict__.update(view_stats.__dict__)
+        copy.statuses = Counter(view_stats.statuses)
+        copy.buckets = list(view_stats.buckets)
+        return copy
+
+
+def _labels(view, method):
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'view="{view}",method="{method}"'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(settings.METRICS_SLOW_BUFFER)
+    return _registry
+
+
+@contextlib.contextmanager
+def serializer_timer():
+    """
+    Adds the time spent inside to the current request's serializer time.
+    Only the outermost serializer of a nested tree is timed.
+    """
+    request_metrics = _current.get()
+    if request_metrics is None:
+        yield
+        return
+    request_metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.serializer_depth -= 1
+        if not request_metrics.serializer_depth:
+            request_metrics.serializer_time += time.perf_counter() - start
+
+
+class TimedSerializerMixin(object):
+    """
+    Counts the serializer's validation and representation towards the
+    request's serializer time.
+    """
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+    def run_validation(self, data=empty):
+        with serializer_timer():
+            return super().run_validation(data)
+
+
+class TimedStream(object):
+    """
+    Content of a streaming response, `finish()` is called once it has
+    been sent or the response closed, whichever comes first.
+    """
+
+    def __init__(self, content, finish):
+        self.content = content
+        self.finish = finish
+
+    def __iter__(self):
+        try:
+            yield from self.content
+        finally:
+            self.close()
+
+    def close(self):
+        if self.finish is not None:
+            finish, self.finish = self.finish, None
+            finish()
+
+
+class MetricsMiddleware(object):
+    """
+    Records every request in the registry under its URL name. With
+    METRICS_SLOW_THRESHOLD set (seconds), requests slower than that are
+    also kept in the slow ring buffer with their SQL. A streaming response
+    is recorded once streamed, with the time and queries of the stream;
+    serializer time is only counted until the view returns.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        request_metrics = RequestMetrics(
+            record_sql=settings.METRICS_SLOW_THRESHOLD is not None)
+        stack = contextlib.ExitStack()
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(request_metrics.execute))
+        token = _current.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        finally:
+            _current.reset(token)
+
+        def finish():
+            stack.close()
+            self.record(request, response, time.perf_counter() - start,
+                        request_metrics)
+        if response.streaming:
+            response.streaming_content = TimedStream(
+                response.streaming_content, finish)
+        else:
+            finish()
+        return response
+
+    def record(self, request, response, duration, request_metrics):
+        threshold = settings.METRICS_SLOW_THRESHOLD
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        registry = get_registry()
+        registry.observe(view, request.method, response.status_code,
+                         duration, request_metrics)
+        if threshold is not None and duration >= threshold:
+            registry.sample(request.path, view, request.method,
+                            response.status_code, duration, request_metrics)
+
+
+class IsMetricsScraper(BasePermission):
+    """
+    Staff users, or clients from METRICS_ALLOWED_IPS: a Prometheus
+    scraper has no user.
+    """
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+@api_view(['GET'])
+@permission_classes([IsMetricsScraper])
+def metrics_view(request):
+    return HttpResponse(get_registry().render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,8 +1,10 @@
 from django.db import models
 from decimal import Decimal
-from django.db.models import Max
-from django.db import IntegrityError
+from django.db.models import F, Q
+from django.db import IntegrityError, transaction
 from django.contrib.auth.models import User
+# internals
+from .fields import MoneyField
 
 
 class Item(models.Model):
@@ -11,14 +13,35 @@ class Item(models.Model):
     """
     name = models.CharField(max_length=120)
     description = models.TextField()
-    price = models.DecimalField(max_digits=12, decimal_places=2,
-                                default=Decimal('1'))
+    price = MoneyField(default=Decimal('1'))
 
     close_datetime = models.DateTimeField(null=True, blank=True)
 
+    # maintained by Bid.save, see `backfill_item_bids` for existing data
+    current_bid_value = MoneyField(null=True, blank=True)
+    current_bidder = models.ForeignKey(User, on_delete=models.SET_NULL,
+                                       null=True, blank=True,
+                                       related_name='+')
+    bid_count = models.PositiveIntegerField(default=0)
+
+    # set by the close scheduler, see `close_auctions`
+    closed_at = models.DateTimeField(null=True, blank=True)
+    winner = models.ForeignKey(User, on_delete=models.SET_NULL,
+                               null=True, blank=True,
+                               related_name='won_items')
+    final_price = MoneyField(null=True, blank=True)
+
     class Meta:
         db_table = 't_item'
-        ordering = ['close_datetime']
+        ordering = ['close_datetime', 'id']
+        indexes = [
+            models.Index(fields=['close_datetime', 'id'],
+                         name='t_item_close_idx'),
+            # only the auctions still to settle, what the scheduler reads
+            models.Index(fields=['close_datetime'],
+                         name='t_item_open_close_idx',
+                         condition=Q(closed_at__isnull=True)),
+        ]
 
     def __str__(self):
         return self.name
@@ -29,6 +52,11 @@ class Image(models.Model):
         Item, on_delete=models.CASCADE, related_name='images')
     path = models.CharField(max_length=1024)
 
+    # filled in from the file at `path`, see api.imaging
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=list, blank=True)
+
     class Meta:
         db_table = 't_image'
 
@@ -43,31 +71,96 @@ class Bid(models.Model):
                              related_name='bids')
     created_date = models.DateTimeField(auto_now_add=True)
     updated_date = models.DateTimeField(auto_now=True)
-    value = models.DecimalField(max_digits=12, decimal_places=2)
+    value = MoneyField()
 
     class Meta:
         db_table = 't_bid'
         unique_together = ('made_by', 'value', 'item')
-        ordering = ['-created_date']
+        ordering = ['-created_date', '-id']
+        indexes = [
+            models.Index(fields=['item', '-created_date'],
+                         name='t_bid_item_created_idx'),
+        ]
 
     def __str__(self):
         return super().__str__()
 
     def save(self, *args, **kwargs):
-        max_value = Bid.objects.filter(item=self.item
-                                       ).aggregate(max_value=Max('value')
-                                                   ).get('max_value')
-        if max_value and self.value < max_value:
-            raise IntegrityError
-        return super(Bid, self).save(*args, **kwargs)
+        """
+        Moves the item's current high bid with a conditional UPDATE in the
+        same transaction as the insert, instead of aggregating t_bid.
+        Raises IntegrityError when the value does not beat it.
+        """
+        adding = self._state.adding
+        changes = {'current_bid_value': self.value,
+                   'current_bidder_id': self.made_by_id}
+        if adding:
+            changes['bid_count'] = F('bid_count') + 1
+            beaten = Q(current_bid_value__lt=self.value)
+        else:
+            beaten = Q(current_bid_value__lte=self.value)
+
+        with transaction.atomic():
+            updated = Item.objects.filter(
+                Q(current_bid_value__isnull=True) | beaten,
+                pk=self.item_id).update(**changes)
+            if not updated:
+                raise IntegrityError
+            super(Bid, self).save(*args, **kwargs)
+
+        if Bid.item.is_cached(self):
+            self.item.current_bid_value = self.value
+            self.item.current_bidder_id = self.made_by_id
+            if adding:
+                self.item.bid_count += 1
 
 
 class AutoBid(models.Model):
     is_active = models.BooleanField(default=True)
-    max_bid_value = models.DecimalField(max_digits=12, decimal_places=2)
+    max_bid_value = MoneyField()
     item = models.ForeignKey("Item", on_delete=models.CASCADE)
     made_by = models.ForeignKey(User, on_delete=models.PROTECT)
 
     class Meta:
         db_table = 't_autobid'
         unique_together = ('made_by', 'item')
+
+
+class ItemStats(models.Model):
+    """
+    Bid analytics of an item, rolled up from its bids up to `last_bid_id`,
+    see api.stats.
+    """
+    item = models.OneToOneField(Item, on_delete=models.CASCADE,
+                                primary_key=True, related_name='stats')
+    last_bid_id = models.BigIntegerField(default=0)
+    bid_count = models.PositiveIntegerField(default=0)
+    bidder_count = models.PositiveIntegerField(default=0)
+    max_value = MoneyField(null=True, blank=True)
+    median_value = MoneyField(null=True, blank=True)
+    # the bid of the lower median rank, where the next update resumes
+    median_rank = models.PositiveIntegerField(default=0)
+    median_bid_id = models.BigIntegerField(default=0)
+    first_bid_at = models.DateTimeField(null=True, blank=True)
+    last_bid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 't_item_stats'
+
+
+class ItemStatsBucket(models.Model):
+    """
+    Bids of an item within ITEM_STATS_BUCKET_SECONDS from `start`, the
+    price series of the stats.
+    """
+    stats = models.ForeignKey(ItemStats, on_delete=models.CASCADE,
+                              related_name='buckets')
+    start = models.DateTimeField()
+    bid_count = models.PositiveIntegerField(default=0)
+    open_value = MoneyField()
+    close_value = MoneyField()
+
+    class Meta:
+        db_table = 't_item_stats_bucket'
+        unique_together = ('stats', 'start')
+        ordering = ['stats', 'start']
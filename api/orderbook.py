@@ -0,0 +1,222 @@
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple
+from django.conf import settings
+from django.db.models import Q
+# internals
+from .fields import cents, from_cents, to_cents
+from .models import AutoBid
+
+logger = logging.getLogger(__name__)
+
+
+class Ceiling(NamedTuple):
+    """
+    The part of an active AutoBid the resolution needs, the ceiling in
+    cents.
+    """
+    id: int
+    max_bid_cents: int
+    made_by_id: int
+
+    @classmethod
+    def of(cls, autobid) -> 'Ceiling':
+        return cls(autobid.id, to_cents(autobid.max_bid_value),
+                   autobid.made_by_id)
+
+
+def load_ceilings(autobids) -> List[Ceiling]:
+    """
+    Ceilings of an AutoBid queryset, read as stored without building
+    model instances or Decimals.
+    """
+    return [Ceiling._make(row) for row in autobids.values_list(
+        'id', cents('max_bid_value'), 'made_by_id')]
+
+
+class AutoBidBook(object):
+    """
+    Active AutoBid ceilings of one item in a max-heap ordered by
+    (max_bid_cents desc, id asc). Changed or deactivated entries are left
+    in the heap and skipped on read, the heap is compacted once the stale
+    entries outnumber the live ones.
+    """
+
+    def __init__(self, ceilings):
+        self.entries = {}
+        self.by_bidder = {}
+        self.stale = 0
+        self.loaded_at = time.monotonic()
+        self.heap = [self._entry(ceiling) for ceiling in ceilings]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _entry(self, ceiling):
+        self.entries[ceiling.id] = ceiling
+        self.by_bidder[ceiling.made_by_id] = ceiling
+        return (-ceiling.max_bid_cents, ceiling.id, ceiling)
+
+    def update(self, autobid):
+        self.remove(autobid.id)
+        if autobid.is_active:
+            heapq.heappush(self.heap, self._entry(Ceiling.of(autobid)))
+
+    def remove(self, autobid_id):
+        ceiling = self.entries.pop(autobid_id, None)
+        if ceiling is None:
+            return
+        if self.by_bidder.get(ceiling.made_by_id) is ceiling:
+            del self.by_bidder[ceiling.made_by_id]
+        self.stale += 1
+        if self.stale > len(self.entries):
+            self.heap = [entry for entry in self.heap
+                         if self.entries.get(entry[1]) is entry[2]]
+            heapq.heapify(self.heap)
+            self.stale = 0
+
+    def candidates(self, made_by_id, others=2) -> List[Ceiling]:
+        """
+        The proxy of `made_by_id`, if any, and the `others` strongest
+        proxies of everybody else: all the resolution of a bid by
+        `made_by_id` can depend on. Walks the top of the heap without
+        popping it, O(others log others).
+        """
+        result = []
+        own = self.by_bidder.get(made_by_id)
+        if own is not None:
+            result.append(own)
+        found = 0
+        frontier = [(self.heap[0][:2], 0)] if self.heap else []
+        while frontier and found < others:
+            _, index = heapq.heappop(frontier)
+            ceiling = self.heap[index][2]
+            if (self.entries.get(ceiling.id) is ceiling and
+                    ceiling.made_by_id != made_by_id):
+                result.append(ceiling)
+                found += 1
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self.heap):
+                    heapq.heappush(frontier, (self.heap[child][:2], child))
+        return result
+
+    def snapshot(self):
+        return set(self.entries.values())
+
+
+class OrderBooks(object):
+    """
+    Per-item AutoBidBooks, loaded on first use and kept for the most
+    recently used `max_items` items. Signals keep them current within this
+    process; `ttl` bounds how long a change made by another process can go
+    unseen, each expired book is checked against the database on reload.
+    """
+    # proxies of other bidders a resolution can depend on
+    others = 2
+
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.books = OrderedDict()
+        self.lock = threading.RLock()
+
+    def load(self, item_id) -> AutoBidBook:
+        return AutoBidBook(load_ceilings(
+            AutoBid.objects.filter(item_id=item_id, is_active=True)))
+
+    def get(self, item_id) -> AutoBidBook:
+        with self.lock:
+            book = self.books.get(item_id)
+            if book is not None:
+                if time.monotonic() - book.loaded_at < self.ttl:
+                    self.books.move_to_end(item_id)
+                    return book
+                if not self.verify(item_id):
+                    logger.warning('auto bid book of item %s was stale', item_id)
+                return self.books[item_id]
+            book = self.books[item_id] = self.load(item_id)
+            if len(self.books) > self.max_items:
+                self.books.popitem(last=False)
+            return book
+
+    def candidates(self, item_id, made_by_id) -> List[Ceiling]:
+        with self.lock:
+            return self.get(item_id).candidates(made_by_id, self.others)
+
+    def checked_candidates(self, item_id, made_by_id) -> List[Ceiling]:
+        """
+        candidates() checked against the database under the item lock:
+        the proxy of `made_by_id`, the candidates themselves and every
+        other active proxy at least as strong as the weakest of them (all
+        of them when the book has fewer than `others`) are read, and the
+        candidates the book should have given picked from those. When
+        another process added, raised, lowered or deactivated a proxy
+        they differ, the book is reloaded and they are returned.
+        """
+        candidates = self.candidates(item_id, made_by_id)
+        others = [ceiling for ceiling in candidates
+                  if ceiling.made_by_id != made_by_id]
+        query = Q(made_by_id=made_by_id) | Q(pk__in=[c.id for c in candidates])
+        if len(others) < self.others:
+            query |= ~Q(made_by_id=made_by_id)
+        else:
+            query |= Q(max_bid_value__gte=from_cents(
+                min(ceiling.max_bid_cents for ceiling in others)))
+        current = load_ceilings(AutoBid.objects.filter(
+            query, item_id=item_id, is_active=True))
+        fresh = AutoBidBook(current).candidates(made_by_id, self.others)
+        if set(fresh) == set(candidates):
+            return candidates
+        logger.warning('auto bid book of item %s was stale', item_id)
+        self.verify(item_id)
+        return fresh
+
+    def update(self, autobid):
+        with self.lock:
+            book = self.books.get(autobid.item_id)
+            if book is not None:
+                book.update(autobid)
+
+    def remove(self, autobid):
+        with self.lock:
+            book = self.books.get(autobid.item_id)
+            if book is not None:
+                book.remove(autobid.id)
+
+    def discard(self, *item_ids):
+        with self.lock:
+            for item_id in item_ids:
+                self.books.pop(item_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.books.clear()
+
+    def verify(self, item_id) -> bool:
+        """
+        Reloads the item's book and tells whether the one in memory held the
+        same ceilings as the database.
+        """
+        fresh = self.load(item_id)
+        with self.lock:
+            book = self.books.get(item_id)
+            self.books[item_id] = fresh
+        return book is None or book.snapshot() == fresh.snapshot()
+
+
+_books = None
+_books_lock = threading.Lock()
+
+
+def get_order_books() -> OrderBooks:
+    global _books
+    if _books is None:
+        with _books_lock:
+            if _books is None:
+                _books = OrderBooks(settings.AUTOBID_BOOK_MAX_ITEMS,
+                                    settings.AUTOBID_BOOK_TTL)
+    return _books
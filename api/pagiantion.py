@@ -1,13 +1,166 @@
+import datetime
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator as DjangoPaginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def approximate_count(queryset, timeout=60):
+    """
+    Row count of `queryset`, cached for `timeout` seconds. An unfiltered
+    table on Postgres is estimated from the planner statistics instead of
+    a COUNT(*).
+    """
+    sql, params = queryset.query.sql_with_params()
+    key = 'count:' + hashlib.md5((sql + repr(params)).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = -1
+        if not queryset.query.where:
+            count = _estimated_table_rows(queryset)
+        if count < 0:
+            count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def _estimated_table_rows(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return -1
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+class ApproximateCountPaginator(DjangoPaginator):
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+
+class KeysetPagination(object):
+    """
+    Forward-only keyset pagination on the model's first ordering field and
+    the primary key, both in that field's direction. Each page is an index
+    range scan that starts after the last row of the previous page, there
+    is no COUNT(*) and no OFFSET. NULLs of the ordering field come last on
+    every database.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        model = queryset.model
+        ordering = model._meta.ordering[0]
+        self.descending = ordering.startswith('-')
+        self.field = model._meta.get_field(ordering.lstrip('-'))
+        self.pk_name = model._meta.pk.attname
+
+        if self.descending:
+            queryset = queryset.order_by(
+                F(self.field.attname).desc(nulls_last=True), '-' + self.pk_name)
+        else:
+            queryset = queryset.order_by(
+                F(self.field.attname).asc(nulls_last=True), self.pk_name)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(*position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.page = rows[:self.page_size]
+        self.has_next = len(rows) > self.page_size
+        return self.page
+
+    def after(self, value, pk):
+        """
+        The rows past (value, pk) in the page order.
+        """
+        name = self.field.attname
+        past = '__lt' if self.descending else '__gt'
+        if value is None:
+            return Q(**{name + '__isnull': True, self.pk_name + past: pk})
+        return (Q(**{name + past: value}) |
+                Q(**{name: value, self.pk_name + past: pk}) |
+                Q(**{name + '__isnull': True}))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if value is not None:
+                value = self.field.to_python(value)
+            return value, int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance):
+        """
+        `instance` is a model instance, or a row of a .values() page.
+        Datetimes keep their microseconds, DjangoJSONEncoder would cut them
+        to milliseconds and the next page would start before the last row.
+        """
+        if isinstance(instance, dict):
+            position = [instance[self.field.attname], instance[self.pk_name]]
+        else:
+            position = [getattr(instance, self.field.attname),
+                        getattr(instance, self.pk_name)]
+        if isinstance(position[0], datetime.datetime):
+            position[0] = position[0].isoformat()
+        return urlsafe_b64encode(
+            json.dumps(position, cls=DjangoJSONEncoder).encode()).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[-1]))
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page numbers by default. `?cursor=` switches to keyset pagination,
+    `?count=approx` returns a cached (or estimated) count and `noPage`
+    returns the rows unpaginated, at most `no_page_max_size` of them.
+    """
     page_size = 10
     page_size_query_param = "limit"
     max_page_size = 20
+    no_page_max_size = 1000
 
     def get_paginated_response(self, data):
+        if self.mode == 'noPage':
+            return Response(data)
+
+        if self.mode == 'cursor':
+            response = {
+                'next': self.keyset.get_next_link(),
+                'previous': None,
+                'results': data
+            }
+            if self.approximate:
+                response['count'] = approximate_count(self.queryset)
+            return Response(response)
+
         return Response({
 
             'next': self.get_next_link(),
@@ -19,6 +172,38 @@ class CustomPagination(PageNumberPagination):
         })
 
     def paginate_queryset(self, queryset, request, view=None):
+        self.queryset = queryset
+        self.approximate = request.query_params.get('count') == 'approx'
         if 'noPage' in request.query_params:
-            return None
-        return super().paginate_queryset(queryset, request, view=view)
\ No newline at end of file
+            self.mode = 'noPage'
+            return list(queryset[:self.no_page_max_size])
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.mode = 'cursor'
+            self.keyset = KeysetPagination(self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view=view)
+        self.mode = 'page'
+        if self.approximate:
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view=view)
+
+
+class BidCursorPagination(PageNumberPagination):
+    """
+    Newest first, by KeysetPagination on (created_date, id) so deep pages
+    stay an index range scan on t_bid(item_id, created_date DESC), ties on
+    created_date included. Forward only, `previous` is always null.
+    """
+    page_size = 20
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination(self.get_page_size(request))
+        return self.keyset.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.keyset.get_next_link(),
+            'previous': None,
+            'results': data
+        })
@@ -1,19 +1,90 @@
-from .services import BidService
-from .models import AutoBid, Bid
+from django.db import transaction
+from .cache import invalidate_item
+from .dispatch import dispatch_on_commit
+from .imaging import render_on_commit
+from .authentication import get_user_cache
+from .orderbook import get_order_books
+from .search import get_search_backend
+from .models import AutoBid, Bid, Item, Image
 
-def auto_bid_receiver_on_bid_save(sender, instance: Bid, **kwargs):
+def dispatch_receiver_on_bid_save(sender, instance: Bid, using, **kwargs):
     """
     Parameters: 
         sender: Model class
         instance: instance of Model class
         kwargs:
             # SEE(django, https://docs.djangoproject.com/en/3.2/ref/signals/#post-save,)
+    Side effects (auto bids, cache, streams, notifications) run after
+    commit on the dispatcher, outside the bid request.
     """
-    service = BidService()
-    service.create_bid_by_auto(instance.item, instance.value, instance.made_by)
+    dispatch_on_commit(instance.item_id, instance, using=using)
 
 
-def receiver_on_autobid_save(sender, instance: AutoBid, created: bool, **kwargs):
-    service = BidService()
-    if created:
-        pass
+def dispatch_receiver_on_autobid_save(sender, instance: AutoBid, using,
+                                      **kwargs):
+    """
+    A new or raised AutoBid may outbid the current high bid right away.
+    """
+    if instance.is_active:
+        dispatch_on_commit(instance.item_id, using=using)
+
+
+def orderbook_receiver_on_autobid_save(sender, instance: AutoBid, using,
+                                       **kwargs):
+    """
+    Applied to the loaded order book once committed, before the auto bids
+    of the item are dispatched.
+    """
+    transaction.on_commit(lambda: get_order_books().update(instance),
+                          using=using)
+
+
+def orderbook_receiver_on_autobid_delete(sender, instance: AutoBid, using,
+                                         **kwargs):
+    transaction.on_commit(lambda: get_order_books().remove(instance),
+                          using=using)
+
+
+def search_receiver_on_item_save(sender, instance: Item, using,
+                                 update_fields=None, **kwargs):
+    if update_fields and not {'name', 'description'} & set(update_fields):
+        return
+    get_search_backend(using).index_item(instance)
+
+
+def search_receiver_on_item_delete(sender, instance: Item, using, **kwargs):
+    get_search_backend(using).remove_item(instance.pk)
+
+
+def search_receiver_on_post_migrate(sender, using, **kwargs):
+    backend = get_search_backend(using)
+    if Item._meta.db_table in backend.connection.introspection.table_names():
+        backend.ensure_index()
+
+
+def imaging_receiver_on_image_save(sender, instance: Image, using,
+                                   update_fields=None, **kwargs):
+    if update_fields and 'path' not in update_fields:
+        return
+    render_on_commit(instance, using=using)
+
+
+def cache_receiver_on_item_change(sender, instance: Item, using, **kwargs):
+    invalidate_item(instance.pk, using=using)
+
+
+def cache_receiver_on_item_child_change(sender, instance, using, **kwargs):
+    """
+    Bids and images are part of the item detail.
+    """
+    invalidate_item(instance.item_id, using=using)
+
+
+def auth_receiver_on_user_change(sender, instance, using, **kwargs):
+    """
+    Evicted now and again after commit, so a request that cached the user
+    in between doesn't keep the old state.
+    """
+    get_user_cache().discard(instance.pk)
+    transaction.on_commit(lambda: get_user_cache().discard(instance.pk),
+                          using=using)
@@ -0,0 +1,58 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+# internals
+from .export import csv_lines, ndjson_lines
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Exports are streamed by the view, a renderer only selects the format
+    (?format= or Accept) and renders what is returned otherwise, e.g.
+    errors, as rows.
+    """
+    lines = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        columns = list(rows[0]) if rows else []
+        return ''.join(self.lines(
+            columns, ([row.get(column) for column in columns] for row in rows)
+        )).encode(self.charset)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    lines = staticmethod(csv_lines)
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    lines = staticmethod(ndjson_lines)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson when it is installed, DRF's stdlib encoding
+    otherwise or for ?indent. Values orjson doesn't serialize itself,
+    datetimes included, go through DRF's encoder, so both give the same
+    JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.get_indent(
+                accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self.encoder_class().default,
+                           option=orjson.OPT_PASSTHROUGH_DATETIME |
+                           orjson.OPT_NON_STR_KEYS)
+        # like JSONRenderer, escaped for JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,95 @@
+import contextlib
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextlib.contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_primary():
+    """
+    Sends the remaining reads of the current request to the primary.
+    """
+    _replica_reads.set(False)
+
+
+def _sticky_key(user_id):
+    return f'replica:sticky:{user_id}'
+
+
+def mark_sticky(user):
+    cache.set(_sticky_key(user.pk), True,
+              settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user) -> bool:
+    return bool(settings.DATABASE_REPLICAS and user.is_authenticated and
+                cache.get(_sticky_key(user.pk)))
+
+
+class ReplicaRouter(object):
+    """
+    Reads go to a random DATABASE_REPLICAS alias only where replica reads
+    were turned on (safe-method requests, see ReplicaRoutingMiddleware)
+    and outside transactions on the primary, so bid validation under the
+    item lock, workers and management commands always read the primary.
+    Writes always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or not _replica_reads.get() or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware(object):
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with replica_reads(request.method in SAFE_METHODS):
+            return self.get_response(request)
+
+
+class ReplicaStickinessMixin(object):
+    """
+    Read-your-writes: after a successful write, the user's reads stay on
+    the primary for DATABASE_REPLICA_STICKY_SECONDS, longer than the
+    replicas are expected to lag.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if is_sticky(request.user):
+            pin_primary()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS
+                and response.status_code < 400 and request.user.is_authenticated):
+            mark_sticky(request.user)
+        return response
@@ -0,0 +1,139 @@
+import heapq
+import logging
+import time
+from datetime import timedelta
+from typing import List
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+# internals
+from .cache import bump_item_version
+from .models import AutoBid, Item
+from .orderbook import get_order_books
+from .services import BidService
+from .signals import auction_closed
+from .stream import publish_close
+
+logger = logging.getLogger(__name__)
+
+
+class CloseScheduler(object):
+    """
+    Closes auctions when their close_datetime passes. The unsettled items
+    closing within `horizon` are read from the partial close_datetime
+    index every `refresh` and kept in a timer heap, so waking up for a
+    deadline doesn't touch the table. Items are settled in bulk, `batch_size`
+    per UPDATE. An item whose close_datetime moved is pushed again with the
+    new one, its stale heap entry is skipped.
+    """
+    horizon = timedelta(minutes=5)
+    refresh = timedelta(seconds=10)
+    batch_size = 500
+
+    def __init__(self, using=None):
+        self.using = using
+        self.heap = []
+        # item id -> the close_datetime it is scheduled for
+        self.scheduled = {}
+        self.loaded_at = None
+
+    def load(self, now):
+        """
+        Schedules the unsettled items due before now + horizon, those past
+        due included.
+        """
+        due = Item.objects.using(self.using).filter(
+            closed_at__isnull=True,
+            close_datetime__lte=now + self.horizon).values_list(
+            'close_datetime', 'id')
+        for close_datetime, item_id in due.iterator():
+            if self.scheduled.get(item_id) != close_datetime:
+                self.scheduled[item_id] = close_datetime
+                heapq.heappush(self.heap, (close_datetime, item_id))
+        self.loaded_at = now
+
+    def due(self, now) -> List[int]:
+        item_ids = []
+        while self.heap and self.heap[0][0] <= now:
+            close_datetime, item_id = heapq.heappop(self.heap)
+            if self.scheduled.get(item_id) == close_datetime:
+                del self.scheduled[item_id]
+                item_ids.append(item_id)
+        return item_ids
+
+    def run_once(self, now=None) -> int:
+        """
+        Settles every item due at `now`, returns how many were closed.
+        """
+        now = now or timezone.now()
+        if self.loaded_at is None or now - self.loaded_at >= self.refresh:
+            self.load(now)
+        item_ids = self.due(now)
+        closed = 0
+        for start in range(0, len(item_ids), self.batch_size):
+            closed += self.settle(item_ids[start:start + self.batch_size], now)
+        return closed
+
+    def next_wakeup(self, now) -> float:
+        wakeup = self.loaded_at + self.refresh
+        if self.heap:
+            wakeup = min(wakeup, self.heap[0][0])
+        return max((wakeup - now).total_seconds(), 0)
+
+    def run(self):
+        while True:
+            closed = self.run_once()
+            if closed:
+                logger.info('%s auctions closed', closed)
+            time.sleep(self.next_wakeup(timezone.now()))
+
+    def settle(self, item_ids, now) -> int:
+        """
+        Winner and final price come from the item's current high bid in the
+        same UPDATE that closes it, so a bid committed right before is
+        accounted for and one validated after sees the item closed. The
+        AutoBids answer that bid first, should its side effects not have
+        run yet. An item whose close_datetime was moved past `now` is left
+        open.
+        """
+        items = Item.objects.using(self.using)
+        with transaction.atomic(using=self.using):
+            settled = list(items.select_for_update().filter(
+                pk__in=item_ids, closed_at__isnull=True,
+                close_datetime__lte=now).values_list('id', flat=True))
+            if not settled:
+                return 0
+            self.answer_auto_bids(settled)
+            items.filter(pk__in=settled).update(
+                closed_at=now,
+                winner_id=F('current_bidder_id'),
+                final_price=F('current_bid_value'))
+            AutoBid.objects.using(self.using).filter(
+                item_id__in=settled, is_active=True).update(is_active=False)
+            transaction.on_commit(lambda: self.closed(settled),
+                                  using=self.using)
+        return len(settled)
+
+    def answer_auto_bids(self, item_ids):
+        """
+        Answers the high bid of the items with active AutoBids, as of the
+        high bid: it was placed before close.
+        """
+        proxied = AutoBid.objects.using(self.using).filter(
+            item_id__in=item_ids, is_active=True).values('item_id')
+        service = BidService()
+        for item in Item.objects.using(self.using).filter(
+                pk__in=proxied, current_bid_value__isnull=False):
+            high_bid = item.bids.filter(value=item.current_bid_value).first()
+            if high_bid is not None:
+                service.answer_auto_bids(item, high_bid.created_date)
+
+    def closed(self, item_ids):
+        get_order_books().discard(*item_ids)
+        items = list(Item.objects.using(self.using).filter(
+            pk__in=item_ids).only('id', 'current_bid_value',
+                                  'current_bidder_id', 'closed_at'))
+        for item in items:
+            bump_item_version(item.id)
+            publish_close(item)
+        auction_closed.send(sender=Item, items=items)
@@ -0,0 +1,139 @@
+import re
+from django.db import connections, router
+from django.db.models import Q
+# internals
+from .models import Item
+
+
+def search_terms(value):
+    """
+    Words of a user query, everything else is dropped so the terms can be
+    embedded in a MATCH / tsquery expression as they are.
+    """
+    return re.findall(r'\w+', value.lower())
+
+
+class LikeSearchBackend(object):
+    """
+    Fallback for databases without full-text search: the old
+    `icontains` filter, a full scan of t_item.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def filter(self, queryset, value):
+        q = Q(name__icontains=value) | Q(description__icontains=value)
+        return queryset.filter(q)
+
+    def ensure_index(self):
+        pass
+
+    def index_item(self, item):
+        pass
+
+    def remove_item(self, item_id):
+        pass
+
+    def rebuild(self):
+        self.ensure_index()
+
+
+class SqliteSearchBackend(LikeSearchBackend):
+    """
+    FTS5 table `t_item_fts` whose rowid is the item id, kept in sync by the
+    Item post_save/post_delete receivers. Terms are prefix-matched and
+    results ranked by bm25 with the name weighted over the description.
+    The table is created after `migrate`: SQLite can't create a virtual
+    table inside a savepoint that is later rolled back.
+    """
+    table = 't_item_fts'
+    weights = (10.0, 1.0)
+
+    def ensure_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING "
+                f"fts5(name, description, tokenize='unicode61 remove_diacritics 2')")
+
+    def match_expression(self, value):
+        return ' '.join(f'"{term}"*' for term in search_terms(value))
+
+    def filter(self, queryset, value):
+        match = self.match_expression(value)
+        if not match:
+            return queryset
+        # a plain join lets FTS5 drive the query and compute bm25 once per
+        # match, a correlated subquery would re-run the MATCH for every row
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {Item._meta.db_table}.id',
+                   f'{self.table} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'bm25({self.table}, %s, %s)'},
+            select_params=self.weights,
+        ).order_by('search_rank', 'id')
+
+    def index_item(self, item):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {self.table} (rowid, name, description) "
+                f"VALUES (%s, %s, %s)", [item.pk, item.name, item.description])
+
+    def remove_item(self, item_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s",
+                           [item_id])
+
+    def rebuild(self):
+        self.ensure_index()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, name, description) "
+                f"SELECT id, name, description FROM {Item._meta.db_table}")
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """
+    Weighted tsvector over name (A) and description (B), served by a GIN
+    expression index built from the same expression, so Postgres keeps it
+    in sync by itself. The index is created after `migrate`.
+    """
+    config = 'english'
+    index_name = 't_item_search_idx'
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return (SearchVector('name', weight='A', config=self.config) +
+                SearchVector('description', weight='B', config=self.config))
+
+    def filter(self, queryset, value):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        terms = search_terms(value)
+        if not terms:
+            return queryset
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms),
+                            search_type='raw', config=self.config)
+        vector = self.vector()
+        return queryset.annotate(search=vector).filter(search=query).annotate(
+            search_rank=SearchRank(vector, query)).order_by('-search_rank', 'id')
+
+    def ensure_index(self):
+        from django.contrib.postgres.indexes import GinIndex
+        with self.connection.cursor() as cursor:
+            constraints = self.connection.introspection.get_constraints(
+                cursor, Item._meta.db_table)
+        if self.index_name not in constraints:
+            with self.connection.schema_editor() as schema_editor:
+                schema_editor.add_index(
+                    Item, GinIndex(self.vector(), name=self.index_name))
+
+
+def get_search_backend(using=None):
+    connection = connections[using or router.db_for_read(Item)]
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend(connection)
+    if connection.vendor == 'sqlite':
+        return SqliteSearchBackend(connection)
+    return LikeSearchBackend(connection)
@@ -1,11 +1,27 @@
 from rest_framework import serializers
-from django.utils import timezone
-from datetime import datetime
 # internal
-from .models import (Item, Image, Bid, AutoBid)
-
-
-class AutoBidSerializer(serializers.ModelSerializer):
+from . import exceptions
+from .fields import MoneyField
+from .fieldsets import SparseFieldsMixin, ValuesSerializerMixin
+from .imaging import save_upload, sources
+from .metrics import TimedSerializerMixin
+from .models import (Item, Image, Bid, AutoBid, ItemStats, ItemStatsBucket)
+from .services import BidService
+
+
+class ModelSerializer(serializers.ModelSerializer):
+    """
+    Base of the api's model serializers: amounts stored in cents
+    (MoneyField) are still decimals in the API.
+    """
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        MoneyField: serializers.DecimalField,
+    }
+
+
+class AutoBidSerializer(SparseFieldsMixin, ValuesSerializerMixin,
+                        TimedSerializerMixin, ModelSerializer):
     item_name = serializers.ReadOnlyField(source='item.name')
 
     class Meta:
@@ -23,18 +39,68 @@ class AutoBidUpdateSerializer(AutoBidSerializer):
         return autobid
 
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(TimedSerializerMixin, ModelSerializer):
+    """
+    An image is created from an uploaded `file`, stored under MEDIA_ROOT,
+    or from a `path` as before. Variants of stored files are rendered
+    after commit, see api.imaging.
+    """
+    file = serializers.ImageField(write_only=True, required=False)
+
     class Meta:
         model = Image
-        fields = ('id', 'path', 'item')
+        fields = ('id', 'path', 'item', 'file', 'width', 'height', 'variants')
+        read_only_fields = ('width', 'height', 'variants')
+        extra_kwargs = {'path': {'required': False}}
+
+    def validate(self, attrs):
+        if self.instance is None and not (attrs.get('file') or attrs.get('path')):
+            raise serializers.ValidationError(
+                {'path': ['Either path or file is required.']})
+        return attrs
+
+    def create(self, validated_data):
+        return super().create(self.store_file(validated_data))
 
+    def update(self, instance, validated_data):
+        return super().update(instance, self.store_file(validated_data))
+
+    def store_file(self, validated_data):
+        upload = validated_data.pop('file', None)
+        if upload is not None:
+            item = validated_data.get('item') or self.instance.item
+            validated_data['path'] = save_upload(item.pk, upload)
+        if (self.instance is not None and
+                validated_data.get('path', self.instance.path) != self.instance.path):
+            # the variants of the old file, rendered again after commit
+            validated_data.update(width=None, height=None, variants=[])
+        return validated_data
+
+
+class ItemImageSerializer(ValuesSerializerMixin, ImageSerializer):
+    """
+    `sources` map to the <source type srcset> elements of a <picture>,
+    width and height give the aspect ratio before anything loads.
+    """
+    sources = serializers.SerializerMethodField()
+
+    values_extra = ('item', 'variants')
+    values_filled = ('sources', )
 
-class ItemImageSerializer(ImageSerializer):
     class Meta(ImageSerializer.Meta):
-        fields = ('id', 'path')
+        fields = ('id', 'path', 'width', 'height', 'sources')
+
+    def get_sources(self, obj):
+        return sources(obj.variants)
 
+    def fill_values(self, rows, data):
+        if 'sources' in self.fields:
+            for row, image in zip(rows, data):
+                image['sources'] = sources(row['variants'])
 
-class BidSerializer(serializers.ModelSerializer):
+
+class BidSerializer(SparseFieldsMixin, ValuesSerializerMixin,
+                    TimedSerializerMixin, ModelSerializer):
 
     class Meta:
         model = Bid
@@ -42,47 +108,53 @@ class BidSerializer(serializers.ModelSerializer):
                   'item', 'value', 'created_date')
 
     def create(self, validated_data):
-        # TODO move to services
-
-        item = validated_data.get('item')
-        made_by = validated_data.get('made_by')
-        if (self._validate_bid_user(item, made_by) and
-            self._check_close_datetime(item) and
-                self._check_if_bid_value_gt_max_bid_amount(validated_data)):
-            return super().create(validated_data)
-
-    def _validate_bid_user(self, item, made_by):
-        last_bid = item.bids.select_related('made_by').first()
-        if last_bid and last_bid.made_by == made_by:
-            raise serializers.ValidationError(
-                "You already made a bid for this item!")
-
-        return True
-
-    def _check_close_datetime(self, item):
-        now = datetime.now(tz=timezone.utc)
-        if item.close_datetime <= now:
-            raise serializers.ValidationError(
-                "Bidding for this item closed! You late.")
-        return True
-
-    def _check_if_bid_value_gt_max_bid_amount(self, vd):
-        autobid = AutoBid.objects.filter(item=vd.get('item'),
-                                         made_by=vd.get('made_by')).first()
-        if autobid and vd.get('value') >= autobid.max_bid_value:
-            raise serializers.ValidationError(
-                "Bid value exceeded the max amount for this item!"
-            )
-        return True
-
-
-class ItemSerializer(serializers.ModelSerializer):
+        try:
+            return BidService().place_bid(**validated_data)
+        except exceptions.ValidationError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class BulkBidSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    One bid of a bulk placement. Items and users are looked up for the
+    whole batch by BidService.place_bids, not per bid.
+    """
+    item = serializers.IntegerField()
+    made_by = serializers.IntegerField()
+    value = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class ItemSerializer(SparseFieldsMixin, ValuesSerializerMixin,
+                     TimedSerializerMixin, ModelSerializer):
+    """
+    On the values path the images of the whole page are read in one
+    query, like the prefetch.
+    """
     images = ItemImageSerializer(many=True, read_only=True)
 
+    values_filled = ('images', )
+
     class Meta:
         model = Item
         fields = ('id', 'name', 'description',
-                  'price', 'close_datetime', 'images', )
+                  'price', 'close_datetime', 'images',
+                  'current_bid_value', 'current_bidder', 'bid_count',
+                  'closed_at', 'winner', 'final_price', )
+        read_only_fields = ('current_bid_value', 'current_bidder',
+                            'bid_count', 'closed_at', 'winner',
+                            'final_price', )
+
+    def fill_values(self, rows, data):
+        if 'images' not in self.fields or not rows:
+            return
+        child = self.fields['images'].child
+        images = list(child.values_queryset(
+            Image.objects.filter(item_id__in=[row['id'] for row in rows])))
+        by_item = {}
+        for image, image_data in zip(images, child.values_data(images)):
+            by_item.setdefault(image['item'], []).append(image_data)
+        for row, item in zip(rows, data):
+            item['images'] = by_item.get(row['id'], [])
 
 
 class MadeBySerializer(serializers.Serializer):
@@ -92,14 +164,61 @@ class MadeBySerializer(serializers.Serializer):
 class ItemBidSerializer(BidSerializer):
     made_by = MadeBySerializer()
 
+    sparse_fields = False
+
     class Meta(BidSerializer.Meta):
         fields = BidSerializer.Meta.fields+('created_date', )
 
 
 class ItemDetailSerializer(ItemSerializer):
-    bids = ItemBidSerializer(many=True)
+    """
+    Embeds only the most recent bids, the full history is paginated
+    under /items/{id}/bids/.
+    """
+    recent_bids_limit = 10
+    # the detail is cached whole, ItemViewSet.retrieve narrows it
+    sparse_fields = False
+
+    bids = serializers.SerializerMethodField()
     max_bid_value = serializers.DecimalField(
+        source='current_bid_value',
         max_digits=12, decimal_places=2, read_only=True)
 
     class Meta(ItemSerializer.Meta):
         fields = ItemSerializer.Meta.fields + ('bids', 'max_bid_value')
+
+    def get_bids(self, obj):
+        bids = obj.bids.select_related('made_by')[:self.recent_bids_limit]
+        return ItemBidSerializer(bids, many=True, context=self.context).data
+
+
+class ItemStatsBucketSerializer(ModelSerializer):
+    class Meta:
+        model = ItemStatsBucket
+        fields = ('start', 'bid_count', 'open_value', 'close_value')
+
+
+class ItemStatsSerializer(TimedSerializerMixin, ModelSerializer):
+    """
+    `series` is the price per ITEM_STATS_BUCKET_SECONDS bucket with bids,
+    read from the prefetched buckets.
+    """
+    bids_per_minute = serializers.SerializerMethodField()
+    series = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ItemStats
+        fields = ('item', 'bid_count', 'bidder_count', 'max_value',
+                  'median_value', 'first_bid_at', 'last_bid_at',
+                  'bids_per_minute', 'series')
+
+    def get_bids_per_minute(self, obj):
+        if not obj.bid_count:
+            return 0.0
+        minutes = (obj.last_bid_at - obj.first_bid_at).total_seconds() / 60
+        return round(obj.bid_count / max(minutes, 1), 2)
+
+    def get_series(self, obj):
+        if obj._state.adding:
+            return []
+        return ItemStatsBucketSerializer(obj.buckets.all(), many=True).data
@@ -1,21 +1,313 @@
+import time
+from datetime import datetime
 from decimal import Decimal
+from typing import List, NamedTuple, Optional
+from django.conf import settings
+from django.db import transaction, connection, OperationalError
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from .exceptions import ValidationError
+from .fields import from_cents, to_cents
 from .models import Bid, AutoBid, Item
+from .orderbook import get_order_books, load_ceilings
 from django.contrib.auth.models import User
 
 
+class Proxy(NamedTuple):
+    """
+    A bidder's ceiling, in cents, taking part in auto-bid resolution.
+    `rank` breaks ties between equal ceilings: the lower one came first.
+    """
+    ceiling: int
+    rank: float
+    made_by_id: int
+
+
+class Resolution(NamedTuple):
+    """
+    Outcome of an auto-bid war: the bids to write, in order, as
+    (made_by_id, value) pairs. Empty when nobody outbids the incoming bid.
+    """
+    bids: List[tuple]
+
+    @property
+    def winner_id(self) -> Optional[int]:
+        return self.bids[-1][0] if self.bids else None
+
+    @property
+    def price(self) -> Optional[Decimal]:
+        return self.bids[-1][1] if self.bids else None
+
+
+class Placement(NamedTuple):
+    """
+    Outcome of one bid of a bulk placement: the bid written, or the
+    ValidationError it was rejected with.
+    """
+    bid: Optional[Bid]
+    error: Optional[ValidationError]
+
+
 class BidService(object):
+    increment = Decimal('1')
+    # attempts and first backoff (seconds) when the item lock can't be taken
+    lock_attempts = 5
+    lock_backoff = 0.02
+
+    def place_bid(self, item: Item, value: Decimal, made_by: User) -> Bid:
+        """
+        Places a bid while holding a per-item lock, so the checks and the
+        insert can't interleave with a concurrent bid on the same item.
+        """
+        def place(locked):
+            self.validate_bid(locked, value, made_by)
+            return Bid.objects.create(item=locked, value=value,
+                                      made_by=made_by)
+        return self.with_item_lock(item.pk, place)
+
+    def place_bids(self, bids) -> List[Placement]:
+        """
+        Places (item_id, value, made_by_id) bids in order, all in one
+        transaction holding the lock of every item involved. Each bid is
+        checked against its item as the previous ones left it, accepted
+        bids are inserted with one bulk_create and each item is updated
+        once. Returns a Placement per bid.
+        """
+        def place(items):
+            made_by_ids = {made_by_id for _, _, made_by_id in bids}
+            users = set(User.objects.filter(
+                pk__in=made_by_ids).values_list('pk', flat=True))
+            autobid_max = {
+                (item_id, made_by_id): max_bid_value
+                for item_id, made_by_id, max_bid_value in AutoBid.objects.filter(
+                    item_id__in=items, made_by_id__in=users).values_list(
+                    'item_id', 'made_by_id', 'max_bid_value')}
+            previous = {pk: item.current_bid_value for pk, item in items.items()}
+
+            placements, accepted = [], []
+            for item_id, value, made_by_id in bids:
+                item = items.get(item_id)
+                try:
+                    if item is None:
+                        raise ValidationError("Item not found!",
+                                              {'item': ['does not exist']})
+                    if made_by_id not in users:
+                        raise ValidationError("User not found!",
+                                              {'made_by': ['does not exist']})
+                    self.check_bid(item, value, made_by_id,
+                                   autobid_max.get((item_id, made_by_id)))
+                except ValidationError as e:
+                    placements.append(Placement(None, e))
+                    continue
+                bid = Bid(item=item, value=value, made_by_id=made_by_id)
+                item.current_bid_value = value
+                item.current_bidder_id = made_by_id
+                item.bid_count += 1
+                accepted.append(bid)
+                placements.append(Placement(bid, None))
+
+            if accepted:
+                self.insert_bids(accepted, previous)
+            return placements
+
+        item_ids = sorted({item_id for item_id, _, _ in bids})
+        return self.with_items_lock(item_ids, place)
+
+    def insert_bids(self, bids, previous):
+        """
+        bulk_create sends no signals, post_save is sent for each bid so the
+        usual side effects are dispatched. Where the backend doesn't return
+        the new ids they are read back: the bids of an item above its
+        `previous` high bid are exactly the ones just inserted.
+        """
+        Bid.objects.bulk_create(bids)
+        items = {bid.item_id: bid.item for bid in bids}
+        Item.objects.bulk_update(
+            items.values(), ['current_bid_value', 'current_bidder', 'bid_count'])
+        if bids[0].pk is None:
+            inserted = Q()
+            for item_id in items:
+                if previous[item_id] is None:
+                    inserted |= Q(item_id=item_id)
+                else:
+                    inserted |= Q(item_id=item_id, value__gt=previous[item_id])
+            ids = {(item_id, value): pk for item_id, value, pk in
+                   Bid.objects.filter(inserted).order_by().values_list(
+                       'item_id', 'value', 'pk')}
+            for bid in bids:
+                bid.pk = ids[(bid.item_id, bid.value)]
+        for bid in bids:
+            bid._state.adding = False
+            bid._state.db = connection.alias
+            post_save.send(sender=Bid, instance=bid, created=True,
+                           update_fields=None, raw=False, using=connection.alias)
+
+    def with_item_lock(self, item_id, func):
+        """
+        Runs `func(item)` in a transaction holding the item lock.
+        """
+        return self.with_lock(lambda: func(self.lock_item(item_id)))
+
+    def with_items_lock(self, item_ids, func):
+        """
+        Runs `func(items)`, the locked items by pk, in a transaction holding
+        the lock of each item.
+        """
+        return self.with_lock(lambda: func(self.lock_items(item_ids)))
+
+    def with_lock(self, func):
+        """
+        Runs `func()`, which takes item locks, in a transaction. Lock
+        timeouts are retried with exponential backoff, unless we are
+        already inside a transaction the retry could not start over, or
+        the transaction committed and the error came from an on_commit
+        callback: retrying would run `func()` twice.
+        """
+        attempts = 1 if connection.in_atomic_block else self.lock_attempts
+        for attempt in range(attempts):
+            committed = []
+            try:
+                with transaction.atomic():
+                    # runs before the callbacks `func()` registers
+                    transaction.on_commit(lambda: committed.append(True))
+                    return func()
+            except OperationalError:
+                if committed or attempt == attempts - 1:
+                    raise
+                time.sleep(self.lock_backoff * 2 ** attempt)
+
+    def lock_item(self, item_id) -> Item:
+        """
+        Row lock on Postgres. SQLite has no row locks, there a no-op UPDATE
+        takes the database write lock before anything is read.
+        """
+        if connection.vendor == 'sqlite':
+            Item.objects.filter(pk=item_id).update(bid_count=F('bid_count'))
+        return Item.objects.select_for_update().get(pk=item_id)
+
+    def lock_items(self, item_ids) -> dict:
+        """
+        Same as lock_item for many items, locked in pk order so two bulk
+        placements can't deadlock. Missing items are left out.
+        """
+        if connection.vendor == 'sqlite':
+            Item.objects.filter(pk__in=item_ids).update(bid_count=F('bid_count'))
+        items = Item.objects.select_for_update().filter(
+            pk__in=item_ids).order_by('pk')
+        return {item.pk: item for item in items}
+
+    def is_closed(self, item: Item, at: Optional[datetime] = None) -> bool:
+        """
+        Whether bidding is closed at `at`, now by default.
+        """
+        if item.closed_at is not None:
+            return True
+        at = at or datetime.now(tz=timezone.utc)
+        return bool(item.close_datetime and item.close_datetime <= at)
+
+    def validate_bid(self, item: Item, value: Decimal, made_by: User):
+        autobid = AutoBid.objects.filter(item=item, made_by=made_by).first()
+        self.check_bid(item, value, made_by.id,
+                       autobid.max_bid_value if autobid else None)
+
+    def check_bid(self, item: Item, value: Decimal, made_by_id: int,
+                  autobid_max: Optional[Decimal]):
+        """
+        The bid rules against the item's state in memory, `autobid_max`
+        being the bidder's own AutoBid ceiling on the item, if any.
+        """
+        if self.is_closed(item):
+            raise ValidationError("Bidding for this item closed! You late.",
+                                  {'item': ['closed']})
+
+        if item.current_bidder_id == made_by_id:
+            raise ValidationError("You already made a bid for this item!",
+                                  {'made_by': ['current bidder']})
+
+        if item.current_bid_value is not None and value <= item.current_bid_value:
+            raise ValidationError(
+                "Your bid value must be higher than max value for this item!",
+                {'value': ['not higher than current bid']})
+
+        if autobid_max is not None and value >= autobid_max:
+            raise ValidationError(
+                "Bid value exceeded the max amount for this item!",
+                {'value': ['exceeds auto bid max']})
+
+    def resolve_auto_bids(self, value: Decimal, made_by_id: int,
+                          ceilings) -> Resolution:
+        """
+        Closed-form proxy bidding (second-price, like eBay).
+        Instead of replaying the +1 ping-pong between competing AutoBids,
+        the strongest ceiling wins at one increment above the runner-up's
+        ceiling (capped at its own), and the runner-up's last bid is its
+        ceiling. Equal ceilings go to the proxy created first.
+        Works in cents on the order book's Ceilings.
+        """
+        value = to_cents(value)
+        increment = to_cents(self.increment)
+        leader = Proxy(value, float('-inf'), made_by_id)
+        challengers = []
+        for ceiling in ceilings:
+            proxy = Proxy(ceiling.max_bid_cents, ceiling.id,
+                          ceiling.made_by_id)
+            if proxy.made_by_id == made_by_id:
+                if proxy.ceiling > value:
+                    leader = proxy
+            elif proxy.ceiling >= value + increment:
+                challengers.append(proxy)
+        if not challengers:
+            return Resolution([])
+
+        contenders = sorted([leader] + challengers,
+                            key=lambda p: (-p.ceiling, p.rank))
+        winner, runner_up = contenders[0], contenders[1]
+        if winner.ceiling > runner_up.ceiling:
+            price = min(winner.ceiling, runner_up.ceiling + increment)
+        else:
+            price = winner.ceiling
+
+        bids = []
+        if value < runner_up.ceiling < price:
+            bids.append((runner_up.made_by_id, from_cents(runner_up.ceiling)))
+        bids.append((winner.made_by_id, from_cents(price)))
+        return Resolution(bids)
+
+    def create_bid_by_auto(self, item_id, as_of=None) -> Optional[Bid]:
+        """
+        Answers the item's current high bid with the outcome of every
+        active AutoBid on it, written under the item lock in one
+        transaction. Returns the last bid written, if any.
+        """
+        return self.with_item_lock(
+            item_id, lambda item: self.answer_auto_bids(item, as_of))
 
-    def create_bid_by_auto(self, item: Item, value: Decimal, made_by: User, **kwargs):
-        autobidding_active_items = AutoBid.objects.filter(
-            item=item, is_active=True).exclude(made_by=made_by)
-        autobid_obj = autobidding_active_items.first()
-        if autobid_obj:
-            value = value + Decimal('1')
-            if value > autobid_obj.max_bid_value:
-                return
-            bid = Bid.objects.create(
-                item=item, value=value, made_by=autobid_obj.made_by)
-            return bid
+    def answer_auto_bids(self, item: Item, as_of=None) -> Optional[Bid]:
+        """
+        create_bid_by_auto on a locked item. Closure is judged at `as_of`,
+        the time of the event answered (now by default): a bid placed
+        before close is answered even when this runs after, as long as
+        the item isn't settled. Only the proxies that can matter are read,
+        from the item's order book, and checked against the database
+        before they bid.
+        """
+        if item.current_bid_value is None or self.is_closed(item, as_of):
+            return None
+        if settings.AUTOBID_BOOK_ENABLED:
+            ceilings = get_order_books().checked_candidates(
+                item.id, item.current_bidder_id)
+        else:
+            ceilings = load_ceilings(
+                AutoBid.objects.filter(item=item, is_active=True))
+        resolution = self.resolve_auto_bids(
+            item.current_bid_value, item.current_bidder_id, ceilings)
+        bid = None
+        for made_by_id, value in resolution.bids:
+            bid = Bid(item=item, value=value, made_by_id=made_by_id)
+            bid.by_autobid = True
+            bid.save()
+        return bid
 
     def activate_auto_bidding(self, autobid: AutoBid):
         bid = Bid.objects.filter(
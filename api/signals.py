@@ -8,3 +8,10 @@ providing_args = [
 ]
 
 autobid_signal = Signal(providing_args=providing_args)
+
+# sent by the bid dispatcher after commit, with `item_id` and the `bids`
+# of the batch; hook notifications here
+bid_placed = Signal()
+
+# sent by the close scheduler after commit, with the settled `items`
+auction_closed = Signal()
@@ -0,0 +1,134 @@
+import datetime
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+# internals
+from .models import Bid, ItemStats, ItemStatsBucket
+from .services import BidService
+
+
+def bucket_start(moment, seconds) -> datetime.datetime:
+    timestamp = moment.timestamp()
+    return datetime.datetime.fromtimestamp(timestamp - timestamp % seconds,
+                                           tz=datetime.timezone.utc)
+
+
+class StatsRollup(object):
+    """
+    Moves an item's ItemStats over the bids past its `last_bid_id`
+    watermark, `batch_size` at a time, so reading the stats never
+    aggregates the bid history. It relies on the bid rules: the bids of an
+    item are inserted under its lock, each above the last, so by id they
+    are in commit order and sorted by value. The max is the last value,
+    and the median is looked up by rank, resuming from the previous one.
+    """
+    batch_size = 5000
+
+    def __init__(self, bucket_seconds=None):
+        self.bucket_seconds = bucket_seconds or settings.ITEM_STATS_BUCKET_SECONDS
+
+    def update(self, item_id) -> ItemStats:
+        """
+        Runs in a transaction holding the stats row lock, lock timeouts
+        are retried like a bid's.
+        """
+        def update():
+            stats = self.lock(item_id)
+            bids = self.new_bids(stats)
+            if not bids:
+                return stats
+            while bids:
+                self.add(stats, bids)
+                bids = self.new_bids(stats) if len(bids) == self.batch_size else []
+            stats.save()
+            return stats
+        return BidService().with_lock(update)
+
+    def lock(self, item_id) -> ItemStats:
+        """
+        Creates the stats row when missing, then locks it before reading
+        it, so two rollups of the item never both read the watermark: a
+        row lock on Postgres, the database write lock on SQLite, like
+        BidService.lock_item.
+        """
+        ItemStats.objects.get_or_create(item_id=item_id)
+        if connection.vendor == 'sqlite':
+            ItemStats.objects.filter(item_id=item_id).update(
+                bid_count=F('bid_count'))
+        return ItemStats.objects.select_for_update().get(item_id=item_id)
+
+    def rebuild(self, item_id) -> ItemStats:
+        with transaction.atomic():
+            ItemStats.objects.filter(item_id=item_id).delete()
+            return self.update(item_id)
+
+    def new_bids(self, stats):
+        return list(Bid.objects.filter(
+            item_id=stats.item_id, id__gt=stats.last_bid_id).order_by('id')
+            .values_list('id', 'made_by_id', 'value', 'created_date')
+            [:self.batch_size])
+
+    def add(self, stats, bids):
+        """
+        `bids` are (id, made_by_id, value, created_date), by id.
+        """
+        bidders = {made_by_id for _, made_by_id, _, _ in bids}
+        if stats.last_bid_id:
+            bidders -= set(Bid.objects.filter(
+                item_id=stats.item_id, made_by_id__in=bidders,
+                id__lte=stats.last_bid_id).order_by().values_list(
+                'made_by_id', flat=True).distinct())
+        stats.bidder_count += len(bidders)
+        stats.bid_count += len(bids)
+        stats.last_bid_id = bids[-1][0]
+        stats.max_value = bids[-1][2]
+        if stats.first_bid_at is None:
+            stats.first_bid_at = bids[0][3]
+        stats.last_bid_at = bids[-1][3]
+        self.add_buckets(stats, bids)
+        self.advance_median(stats)
+
+    def add_buckets(self, stats, bids):
+        groups = {}
+        for _, _, value, created_date in bids:
+            start = bucket_start(created_date, self.bucket_seconds)
+            group = groups.get(start)
+            if group is None:
+                groups[start] = [1, value, value]
+            else:
+                group[0] += 1
+                group[2] = value
+
+        existing = {bucket.start: bucket for bucket in
+                    ItemStatsBucket.objects.filter(stats=stats, start__in=groups)}
+        created, changed = [], []
+        for start, (count, open_value, close_value) in groups.items():
+            bucket = existing.get(start)
+            if bucket is None:
+                created.append(ItemStatsBucket(
+                    stats=stats, start=start, bid_count=count,
+                    open_value=open_value, close_value=close_value))
+            else:
+                bucket.bid_count += count
+                bucket.close_value = close_value
+                changed.append(bucket)
+        ItemStatsBucket.objects.bulk_create(created)
+        ItemStatsBucket.objects.bulk_update(changed, ['bid_count', 'close_value'])
+
+    def advance_median(self, stats):
+        """
+        Reads the bids of the lower and upper median ranks, counting from
+        the previous lower median bid: about half as many rows as bids
+        were added.
+        """
+        lower, upper = (stats.bid_count + 1) // 2, stats.bid_count // 2 + 1
+        first = stats.median_rank or 1
+        rows = list(Bid.objects.filter(
+            item_id=stats.item_id, id__gte=stats.median_bid_id,
+            id__lte=stats.last_bid_id).order_by('id').values_list('id', 'value')
+            [lower - first:upper - first + 1])
+        if not rows:
+            return
+        stats.median_rank = lower
+        stats.median_bid_id = rows[0][0]
+        stats.median_value = (rows[0][1] + rows[-1][1]) / 2
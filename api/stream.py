@@ -0,0 +1,133 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+
+class LocalBackend(object):
+    """
+    In-process backend, a publish is handed straight back to the hubs of
+    this process. A cross-process backend (e.g. Redis pub/sub) implements
+    the same two methods and calls the listeners for messages it receives.
+    """
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def publish(self, channel: str, payload: str):
+        for listener in self.listeners:
+            listener(channel, payload)
+
+
+class Subscription(object):
+    """
+    Async iterator over the payloads published to one item. Must be created
+    inside the event loop that consumes it; publishers on other threads
+    hand payloads over with call_soon_threadsafe. A watcher that falls
+    behind loses the oldest payloads, not the newest.
+    """
+
+    def __init__(self, hub, channel, maxsize):
+        self.hub = hub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def push(self, payload):
+        try:
+            self.loop.call_soon_threadsafe(self._put, payload)
+        except RuntimeError:
+            # loop already closed, the watcher is gone
+            self.close()
+
+    def _put(self, payload):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class BroadcastHub(object):
+    """
+    Fans item events out to every watcher of the item. An event is encoded
+    once and the same payload is queued for each subscriber.
+    """
+    queue_size = 100
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+        backend.add_listener(self.deliver)
+
+    def publish(self, item_id, event: dict):
+        payload = json.dumps(event, cls=DjangoJSONEncoder,
+                             separators=(',', ':'))
+        self.backend.publish(str(item_id), payload)
+
+    def deliver(self, channel, payload):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.push(payload)
+
+    def subscribe(self, item_id) -> Subscription:
+        subscription = Subscription(self, str(item_id), self.queue_size)
+        with self.lock:
+            self.subscribers[subscription.channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.channel]
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub() -> BroadcastHub:
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                backend = import_string(settings.BID_STREAM_BACKEND)()
+                _hub = BroadcastHub(backend)
+    return _hub
+
+
+def publish_bid(bid):
+    get_hub().publish(bid.item_id, {
+        'type': 'bid',
+        'item': bid.item_id,
+        'bid': bid.id,
+        'value': bid.value,
+        'made_by': bid.made_by_id,
+    })
+
+
+def publish_close(item):
+    get_hub().publish(item.id, {
+        'type': 'close',
+        'item': item.id,
+        'value': item.current_bid_value,
+        'made_by': item.current_bidder_id,
+    })
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import tempfile
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+# internals
+from src.db.config import database_from_env
+from src.db.pool import ConnectionPool, PoolTimeout
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def pool(self, max_size=2, health_check_interval=30):
+        connected = []
+
+        def connect():
+            connection = sqlite3.connect(':memory:', check_same_thread=False)
+            connected.append(connection)
+            return connection
+        return ConnectionPool(connect, max_size, timeout=0.01,
+                              health_check_interval=health_check_interval), connected
+
+    def test_released_connection_is_reused(self):
+        pool, connected = self.pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(len(connected), 1)
+
+    def test_pool_is_bounded(self):
+        pool, _ = self.pool(max_size=2)
+        first, second = pool.acquire(), pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+
+    def test_broken_connection_is_replaced(self):
+        pool, connected = self.pool(health_check_interval=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.close()
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertEqual(len(connected), 2)
+
+    def test_connection_with_errors_is_not_reused(self):
+        pool, connected = self.pool()
+        connection = pool.acquire()
+        pool.release(connection, reusable=False)
+        self.assertIsNot(pool.acquire(), connection)
+
+
+class DatabaseFromEnvTestCase(SimpleTestCase):
+    def test_sqlite_by_default(self):
+        database = database_from_env({}, 'prod.sqlite3')
+        self.assertEqual(database['ENGINE'], 'src.db.sqlite3')
+        self.assertEqual(database['NAME'], 'prod.sqlite3')
+
+    def test_postgresql_with_pool(self):
+        database = database_from_env({'DB_ENGINE': 'postgresql', 'DB_NAME': 'auction',
+                                      'DB_CONN_MAX_AGE': '300',
+                                      'DB_POOL_MAX_SIZE': '20'}, None)
+        self.assertEqual(database['ENGINE'], 'src.db.postgresql')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['POOL'], {'MAX_SIZE': 20, 'TIMEOUT': 10})
+
+    def test_persistent_postgresql(self):
+        database = database_from_env({'DB_ENGINE': 'postgresql',
+                                      'DB_CONN_MAX_AGE': '300'}, None)
+        self.assertEqual(database['CONN_MAX_AGE'], 300)
+        self.assertNotIn('POOL', database)
+
+
+class SqliteWalTestCase(SimpleTestCase):
+    def test_pragmas_are_set_on_connect(self):
+        with tempfile.TemporaryDirectory() as directory:
+            connections = ConnectionHandler({'default': {
+                'ENGINE': 'src.db.sqlite3',
+                'NAME': os.path.join(directory, 'db.sqlite3'),
+                'PRAGMAS': {'busy_timeout': 1234}}})
+            connection = connections['default']
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 1234)
+            finally:
+                connection.close()
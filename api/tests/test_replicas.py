@@ -0,0 +1,118 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+import datetime
+import os
+import pytz
+import shutil
+import sqlite3
+import tempfile
+# internals
+from api.models import Item
+from api.replicas import (ReplicaRouter, ReplicaRoutingMiddleware, is_sticky,
+                          replica_reads)
+from src.db.config import replicas_from_env
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTestCase(TransactionTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_use_the_primary_by_default(self):
+        self.assertIsNone(self.router.db_for_read(Item))
+
+    def test_replica_reads_outside_transactions(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Item), 'replica')
+            with transaction.atomic():
+                self.assertIsNone(self.router.db_for_read(Item))
+        self.assertEqual(self.router.db_for_write(Item), 'default')
+
+    def test_middleware_enables_replicas_for_safe_methods(self):
+        routed = []
+
+        def get_response(request):
+            routed.append(self.router.db_for_read(Item))
+            return HttpResponse()
+        middleware = ReplicaRoutingMiddleware(get_response)
+        factory = RequestFactory()
+        middleware(factory.get('/'))
+        middleware(factory.post('/'))
+        self.assertEqual(routed, ['replica', None])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], BID_DISPATCH_EAGER=True)
+class ReplicaStickinessTestCase(TransactionTestCase):
+    """
+    The replica is a second SQLite database, a copy of the primary taken
+    once the fixtures are in: it lags behind every write made after.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.databases['replica'] = {
+            'ENGINE': 'src.db.sqlite3',
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+        }
+        # declared once configured, the test runner only knows the others
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections.databases['replica']
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.item = Item.objects.create(
+            name='item', description='description',
+            close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC))
+        connections['default'].ensure_connection()
+        connections['replica'].close()
+        with sqlite3.connect(connections.databases['replica']['NAME']) as replica:
+            connections['default'].connection.backup(replica)
+
+    def get_bids(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get(reverse('api:bids-list'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_user_reads_primary_after_a_bid(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        self.assertFalse(is_sticky(self.user))
+        response = client.post(reverse('api:bids-list'),
+                               {'item': self.item.id, 'made_by': self.user.id, 'value': 12})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(is_sticky(self.user))
+        self.assertEqual(len(self.get_bids(self.user)), 1)
+        # everybody else reads the replica, which hasn't seen the bid
+        self.assertEqual(self.get_bids(self.other), [])
+
+
+class ReplicasFromEnvTestCase(TestCase):
+    def test_sqlite_replica_files(self):
+        primary = {'ENGINE': 'src.db.sqlite3', 'NAME': 'db.sqlite3'}
+        replicas = replicas_from_env({'DB_REPLICA_NAMES': 'a.sqlite3, b.sqlite3'}, primary)
+        self.assertEqual(sorted(replicas), ['replica1', 'replica2'])
+        self.assertEqual(replicas['replica2']['NAME'], 'b.sqlite3')
+        self.assertEqual(replicas['replica1']['TEST'], {'MIRROR': 'default'})
+
+    def test_postgresql_replica_hosts(self):
+        primary = {'ENGINE': 'src.db.postgresql', 'NAME': 'auction', 'HOST': 'db'}
+        replicas = replicas_from_env({'DB_REPLICA_HOSTS': 'db-ro'}, primary)
+        self.assertEqual(replicas['replica1']['HOST'], 'db-ro')
+        self.assertEqual(replicas['replica1']['NAME'], 'auction')
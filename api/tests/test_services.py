@@ -0,0 +1,628 @@
+import itertools
+import json
+import threading
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, models, transaction
+from io import StringIO
+from django.contrib.auth.models import User
+from rest_framework import serializers
+import decimal
+import datetime
+import pytz
+# internals
+from api.models import *
+from api.services import BidService
+from api.dispatch import Dispatcher
+from api.fields import MoneyField
+from api.orderbook import AutoBidBook, Ceiling, get_order_books
+from api.scheduler import CloseScheduler
+from api.serializers import BidSerializer
+from api.stats import StatsRollup
+from api import exceptions
+
+
+@override_settings(BID_DISPATCH_EAGER=True)
+class AutoBidResolutionTestCase(TestCase):
+    def setUp(self):
+        get_order_books().clear()
+        self.service = BidService()
+        self.users = [User.objects.create_user('user%d' % i, password='pass')
+                      for i in range(4)]
+        self.item = Item.objects.create(name='item', description='description',
+                                        price=decimal.Decimal('10'),
+                                        close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC))
+
+    def autobid(self, user, max_bid_value, is_active=True):
+        return AutoBid.objects.create(made_by=user, item=self.item, is_active=is_active,
+                                      max_bid_value=decimal.Decimal(max_bid_value))
+
+    def bid(self, user, value):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Bid.objects.create(made_by=user, item=self.item,
+                                      value=decimal.Decimal(value))
+
+    def test_no_autobid(self):
+        self.bid(self.users[0], 20)
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_single_proxy_outbids_by_one_increment(self):
+        self.autobid(self.users[1], 100)
+        self.bid(self.users[0], 20)
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual(top.made_by, self.users[1])
+        self.assertEqual(top.value, decimal.Decimal('21'))
+        self.assertEqual(Bid.objects.count(), 2)
+
+    def test_proxy_below_next_increment_does_not_answer(self):
+        self.autobid(self.users[1], '20.50')
+        self.bid(self.users[0], 20)
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_proxy_war_is_settled_in_one_pass(self):
+        self.autobid(self.users[1], 5000)
+        self.autobid(self.users[2], 9000)
+        self.bid(self.users[0], 20)
+        values = list(Bid.objects.order_by('value').values_list('made_by', 'value'))
+        self.assertEqual(values, [(self.users[0].id, decimal.Decimal('20')),
+                                  (self.users[1].id, decimal.Decimal('5000')),
+                                  (self.users[2].id, decimal.Decimal('5001'))])
+
+    def test_incoming_bidder_proxy_defends_the_lead(self):
+        self.autobid(self.users[0], 300)
+        self.autobid(self.users[1], 250)
+        self.bid(self.users[0], 20)
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual(top.made_by, self.users[0])
+        self.assertEqual(top.value, decimal.Decimal('251'))
+        self.assertEqual(Bid.objects.count(), 3)
+
+    def test_equal_ceilings_go_to_the_earlier_proxy(self):
+        self.autobid(self.users[1], 400)
+        self.autobid(self.users[2], 400)
+        self.bid(self.users[0], 20)
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual(top.made_by, self.users[1])
+        self.assertEqual(top.value, decimal.Decimal('400'))
+
+    def test_inactive_proxy_is_ignored(self):
+        self.autobid(self.users[1], 100, is_active=False)
+        self.bid(self.users[0], 20)
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_new_autobid_answers_current_bid(self):
+        self.bid(self.users[0], 20)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autobid(self.users[1], 100)
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual(top.made_by, self.users[1])
+        self.assertEqual(top.value, decimal.Decimal('21'))
+
+    def test_bid_placed_right_before_close_is_answered_after(self):
+        self.autobid(self.users[1], 100)
+        with self.captureOnCommitCallbacks() as callbacks:
+            bid = Bid.objects.create(made_by=self.users[0], item=self.item,
+                                     value=decimal.Decimal('50'))
+        # the side effects run once the auction has closed
+        Item.objects.filter(pk=self.item.pk).update(
+            close_datetime=bid.created_date + datetime.timedelta(microseconds=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual((top.made_by, top.value), (self.users[1], decimal.Decimal('51')))
+
+    def test_new_autobid_after_close_does_not_bid(self):
+        self.bid(self.users[0], 20)
+        Item.objects.filter(pk=self.item.pk).update(
+            close_datetime=datetime.datetime(2000, 1, 1, tzinfo=pytz.UTC))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autobid(self.users[1], 100)
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_resolve_without_challengers(self):
+        resolution = self.service.resolve_auto_bids(
+            decimal.Decimal('20'), self.users[0].id, [])
+        self.assertEqual(resolution.bids, [])
+        self.assertIsNone(resolution.winner_id)
+
+
+    def test_order_book_follows_autobid_changes(self):
+        autobid = self.autobid(self.users[1], 100)
+        self.bid(self.users[0], 20)
+        with self.captureOnCommitCallbacks(execute=True):
+            autobid.is_active = False
+            autobid.save()
+        self.assertTrue(get_order_books().verify(self.item.id))
+        self.bid(self.users[2], 30)
+        self.assertEqual(Bid.objects.order_by('-value').first().made_by, self.users[2])
+
+    def test_order_book_detects_unsignalled_change(self):
+        self.autobid(self.users[1], 100)
+        self.bid(self.users[0], 20)
+        AutoBid.objects.filter(item=self.item).update(is_active=False)
+        self.assertFalse(get_order_books().verify(self.item.id))
+        self.assertTrue(get_order_books().verify(self.item.id))
+
+    def test_proxy_deactivated_by_another_process_does_not_bid(self):
+        autobid = self.autobid(self.users[1], 100)
+        self.bid(self.users[0], 20)
+        # an update from another worker, no signal reaches this book
+        AutoBid.objects.filter(pk=autobid.pk).update(is_active=False)
+        self.bid(self.users[2], 30)
+        self.assertEqual(Bid.objects.order_by('-value').first().made_by, self.users[2])
+        self.assertTrue(get_order_books().verify(self.item.id))
+
+    def test_proxy_lowered_by_another_process_bids_its_current_max(self):
+        autobid = self.autobid(self.users[1], 100)
+        self.autobid(self.users[3], 60)
+        self.bid(self.users[0], 20)
+        AutoBid.objects.filter(pk=autobid.pk).update(max_bid_value=decimal.Decimal('70'))
+        self.bid(self.users[2], 80)
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual((top.made_by, top.value), (self.users[2], decimal.Decimal('80')))
+        self.assertFalse(Bid.objects.filter(made_by=self.users[1], value__gt=70).exists())
+
+    def test_proxy_added_by_another_process_answers(self):
+        self.autobid(self.users[1], 100)
+        self.bid(self.users[0], 20)
+        # created by another worker, no signal reaches this book
+        AutoBid.objects.bulk_create([AutoBid(made_by=self.users[3], item=self.item,
+                                             max_bid_value=decimal.Decimal('1000'))])
+        self.bid(self.users[2], 500)
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual((top.made_by, top.value), (self.users[3], decimal.Decimal('501')))
+        self.assertTrue(get_order_books().verify(self.item.id))
+
+    def test_proxy_raised_by_another_process_answers(self):
+        self.autobid(self.users[1], 100)
+        self.autobid(self.users[2], 90)
+        autobid = self.autobid(self.users[3], 30)
+        self.bid(self.users[0], 20)
+        AutoBid.objects.filter(pk=autobid.pk).update(max_bid_value=decimal.Decimal('1000'))
+        self.bid(self.users[0], 200)
+        top = Bid.objects.order_by('-value').first()
+        self.assertEqual((top.made_by, top.value), (self.users[3], decimal.Decimal('201')))
+
+
+class AutoBidBookTestCase(TestCase):
+    def autobid(self, id, max_bid_value, made_by_id, is_active=True):
+        return AutoBid(id=id, item_id=1, made_by_id=made_by_id, is_active=is_active,
+                       max_bid_value=decimal.Decimal(max_bid_value))
+
+    def ceiling(self, *args):
+        return Ceiling.of(self.autobid(*args))
+
+    def test_candidates_are_own_proxy_and_two_strongest_others(self):
+        book = AutoBidBook([self.ceiling(i, 100 + i % 7, i)
+                            for i in range(1, 50)])
+        candidates = book.candidates(made_by_id=3)
+        self.assertEqual([c.made_by_id for c in candidates], [3, 6, 13])
+
+    def test_update_and_remove_skip_stale_entries(self):
+        book = AutoBidBook([self.ceiling(1, 500, 1), self.ceiling(2, 400, 2),
+                            self.ceiling(3, 300, 3)])
+        book.update(self.autobid(1, 500, 1, is_active=False))
+        book.update(self.autobid(3, 900, 3))
+        book.remove(2)
+        self.assertEqual(len(book), 1)
+        self.assertEqual([c.id for c in book.candidates(made_by_id=None)], [3])
+
+
+class ItemCurrentBidTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user('user%d' % i, password='pass')
+                      for i in range(2)]
+        self.item = Item.objects.create(name='item', description='description',
+                                        price=decimal.Decimal('10'),
+                                        close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC))
+
+    def test_bid_moves_current_bid(self):
+        Bid.objects.create(made_by=self.users[0], item=self.item, value=11)
+        Bid.objects.create(made_by=self.users[1], item=self.item, value=12)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_bid_value, decimal.Decimal('12'))
+        self.assertEqual(self.item.current_bidder, self.users[1])
+        self.assertEqual(self.item.bid_count, 2)
+
+    def test_lower_or_equal_bid_is_rejected(self):
+        Bid.objects.create(made_by=self.users[0], item=self.item, value=11)
+        for value in (10, 11):
+            with self.assertRaises(IntegrityError):
+                Bid.objects.create(made_by=self.users[1], item=self.item,
+                                   value=value)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.bid_count, 1)
+        self.assertEqual(self.item.current_bidder, self.users[0])
+
+    def test_backfill_item_bids(self):
+        Bid.objects.create(made_by=self.users[0], item=self.item, value=11)
+        Bid.objects.create(made_by=self.users[1], item=self.item, value=12)
+        Item.objects.update(current_bid_value=None, current_bidder=None,
+                            bid_count=0)
+        call_command('backfill_item_bids', stdout=StringIO())
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_bid_value, decimal.Decimal('12'))
+        self.assertEqual(self.item.current_bidder, self.users[1])
+        self.assertEqual(self.item.bid_count, 2)
+
+
+class MoneyFieldTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='pass')
+        self.item = Item.objects.create(name='item', description='description',
+                                        price=decimal.Decimal('10.05'))
+
+    def test_stored_in_cents_read_as_decimal(self):
+        Bid.objects.create(made_by=self.user, item=self.item,
+                           value=decimal.Decimal('12.34'))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT price, current_bid_value FROM t_item')
+            self.assertEqual(cursor.fetchone(), (1005, 1234))
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.price, decimal.Decimal('10.05'))
+        self.assertEqual(str(self.item.current_bid_value), '12.34')
+
+    def test_lookups_and_aggregates_in_cents(self):
+        for value in ('11.10', '11.20', '12'):
+            Bid.objects.create(made_by=self.user, item=self.item,
+                               value=decimal.Decimal(value))
+        self.assertEqual(Bid.objects.filter(value__gt='11.1').count(), 2)
+        self.assertEqual(Bid.objects.aggregate(total=models.Sum('value'))['total'],
+                         decimal.Decimal('34.30'))
+
+    def test_serializer_mapping_stays_in_the_api(self):
+        self.assertIsInstance(BidSerializer().fields['value'], serializers.DecimalField)
+        self.assertNotIn(MoneyField, serializers.ModelSerializer.serializer_field_mapping)
+
+
+class MoneyConversionTestCase(TransactionTestCase):
+    def test_decimal_columns_are_converted_once(self):
+        field = Bid._meta.get_field('value')
+        decimal_field = models.DecimalField(max_digits=12, decimal_places=2)
+        decimal_field.set_attributes_from_name('value')
+        decimal_field.model = Bid
+        with connection.schema_editor() as schema_editor:
+            schema_editor.alter_field(Bid, field, decimal_field)
+        user = User.objects.create_user('user', password='pass')
+        item = Item.objects.create(name='item', description='description')
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO t_bid (made_by_id, item_id, value, '
+                           'created_date, updated_date) VALUES (%s, %s, %s, '
+                           'CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)',
+                           [user.id, item.id, '12.34'])
+
+        out = StringIO()
+        call_command('convert_money_to_cents', stdout=out)
+        self.assertIn('t_bid.value', out.getvalue())
+        call_command('convert_money_to_cents', stdout=out)
+        self.assertIn('0 columns converted', out.getvalue())
+        self.assertEqual(Bid.objects.get().value, decimal.Decimal('12.34'))
+
+
+@override_settings(BID_DISPATCH_EAGER=True)
+class BidPlacementConcurrencyTestCase(TransactionTestCase):
+    threads = 8
+    bids_per_thread = 5
+
+    def setUp(self):
+        get_order_books().clear()
+        self.users = [User.objects.create_user('user%d' % i, password='pass')
+                      for i in range(self.threads)]
+        self.item = Item.objects.create(name='item', description='description',
+                                        price=decimal.Decimal('10'),
+                                        close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC))
+
+    def place_bids(self, user, values, results):
+        service = BidService()
+        service.lock_attempts = 50
+        try:
+            for _ in range(self.bids_per_thread):
+                with self.values_lock:
+                    value = next(values)
+                try:
+                    service.place_bid(self.item, value, user)
+                    results.append('placed')
+                except exceptions.ValidationError:
+                    results.append('rejected')
+        finally:
+            connection.close()
+
+    def test_concurrent_bids_build_strictly_increasing_ladder(self):
+        results = []
+        values = itertools.count(11)
+        self.values_lock = threading.Lock()
+        workers = [threading.Thread(target=self.place_bids,
+                                    args=(user, values, results))
+                   for user in self.users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(results), self.threads * self.bids_per_thread)
+        ladder = list(Bid.objects.filter(item=self.item).order_by('id')
+                      .values_list('value', 'made_by'))
+        self.assertEqual(len(ladder), results.count('placed'))
+        values = [value for value, _ in ladder]
+        self.assertEqual(values, sorted(set(values)))
+        for (_, previous), (_, current) in zip(ladder, ladder[1:]):
+            self.assertNotEqual(previous, current)
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.bid_count, len(ladder))
+        self.assertEqual(self.item.current_bid_value, values[-1])
+        self.assertEqual(self.item.current_bidder_id, ladder[-1][1])
+
+
+class DispatcherTestCase(TestCase):
+    def test_events_of_a_waiting_item_are_coalesced(self):
+        handled = []
+        started, release = threading.Event(), threading.Event()
+
+        def handler(item_id, events):
+            started.set()
+            release.wait(5)
+            handled.append((item_id, events))
+
+        dispatcher = Dispatcher(handler, workers=1)
+        dispatcher.submit(1, 'a')
+        started.wait(5)
+        # item 1 is running, item 2 waits behind it
+        dispatcher.submit(1, 'b')
+        dispatcher.submit(2, 'c')
+        dispatcher.submit(1, 'd')
+        dispatcher.submit(2, 'e')
+        release.set()
+        dispatcher.join()
+        self.assertEqual(handled, [(1, ['a']), (2, ['c', 'e']), (1, ['b', 'd'])])
+
+    def test_failing_handler_does_not_stop_the_worker(self):
+        handled = []
+
+        def handler(item_id, events):
+            if item_id == 1:
+                raise ValueError
+            handled.append(item_id)
+
+        dispatcher = Dispatcher(handler, workers=1)
+        with self.assertLogs('api.dispatch', 'ERROR'):
+            dispatcher.submit(1)
+            dispatcher.submit(2)
+            dispatcher.join()
+        self.assertEqual(handled, [2])
+
+    def test_bid_is_dispatched_after_commit(self):
+        user = User.objects.create_user('user', password='pass')
+        item = Item.objects.create(name='item', description='description',
+                                   close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC))
+        dispatcher = mock.Mock()
+        with mock.patch('api.dispatch.get_dispatcher', return_value=dispatcher):
+            with self.captureOnCommitCallbacks(execute=True):
+                bid = Bid.objects.create(made_by=user, item=item, value=12)
+                dispatcher.submit.assert_not_called()
+        dispatcher.submit.assert_called_once_with(item.id, bid)
+
+    @override_settings(BID_DISPATCH_EAGER=True)
+    def test_eager_side_effect_errors_are_logged(self):
+        user = User.objects.create_user('user', password='pass')
+        item = Item.objects.create(name='item', description='description',
+                                   close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC))
+        with mock.patch('api.dispatch.StatsRollup.update', side_effect=RuntimeError), \
+                self.assertLogs('api.dispatch', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                bid = BidService().place_bid(item, decimal.Decimal('12'), user)
+        self.assertTrue(Bid.objects.filter(pk=bid.pk).exists())
+
+
+class WithLockTestCase(TransactionTestCase):
+    def test_committed_transaction_is_not_retried(self):
+        item = Item.objects.create(name='item', description='description')
+        calls = []
+
+        def func():
+            calls.append(BidService().lock_item(item.id))
+            transaction.on_commit(mock.Mock(side_effect=OperationalError('locked')))
+
+        with self.assertRaises(OperationalError):
+            BidService().with_lock(func)
+        self.assertEqual(len(calls), 1)
+
+    def test_lock_timeout_is_retried(self):
+        calls = []
+
+        def func():
+            calls.append(None)
+            if len(calls) < 3:
+                raise OperationalError('locked')
+            return len(calls)
+
+        self.assertEqual(BidService().with_lock(func), 3)
+
+
+class CloseSchedulerTestCase(TestCase):
+    def setUp(self):
+        self.now = datetime.datetime(2071, 1, 1, 12, tzinfo=pytz.UTC)
+        self.users = [User.objects.create_user('user%d' % i, password='pass')
+                      for i in range(2)]
+        self.scheduler = CloseScheduler()
+
+    def item(self, minutes):
+        return Item.objects.create(name='item', description='description',
+                                   close_datetime=self.now + datetime.timedelta(minutes=minutes))
+
+    def test_due_items_are_settled_in_bulk(self):
+        sold, unsold, later = self.item(-1), self.item(0), self.item(1)
+        Bid.objects.create(made_by=self.users[0], item=sold, value=12)
+        Bid.objects.create(made_by=self.users[1], item=sold, value=15)
+        AutoBid.objects.create(made_by=self.users[0], item=sold, max_bid_value=15)
+        AutoBid.objects.create(made_by=self.users[0], item=later, max_bid_value=20)
+
+        with mock.patch('api.scheduler.publish_close') as publish_close, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.scheduler.run_once(self.now), 2)
+        self.assertEqual(sorted(call.args[0].id for call in publish_close.call_args_list),
+                         [sold.id, unsold.id])
+
+        sold.refresh_from_db()
+        self.assertEqual(sold.closed_at, self.now)
+        self.assertEqual(sold.winner, self.users[1])
+        self.assertEqual(sold.final_price, decimal.Decimal('15'))
+        unsold.refresh_from_db()
+        self.assertEqual(unsold.closed_at, self.now)
+        self.assertIsNone(unsold.winner)
+        self.assertIsNone(Item.objects.get(pk=later.pk).closed_at)
+        self.assertEqual(list(AutoBid.objects.filter(is_active=True).values_list('item', flat=True)),
+                         [later.id])
+
+    def test_timer_heap_wakes_up_for_the_next_deadline(self):
+        first, second = self.item(1), self.item(2)
+        self.item(60)
+        self.assertEqual(self.scheduler.run_once(self.now), 0)
+        self.assertEqual(len(self.scheduler.heap), 2)
+        self.assertEqual(self.scheduler.next_wakeup(self.now), 10)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scheduler.due(self.now + datetime.timedelta(minutes=1)),
+                             [first.id])
+        self.scheduler.run_once(self.now + datetime.timedelta(minutes=2))
+        self.assertIsNotNone(Item.objects.get(pk=second.pk).closed_at)
+
+    def test_moved_close_datetime_is_not_settled(self):
+        item = self.item(1)
+        self.scheduler.load(self.now)
+        Item.objects.filter(pk=item.pk).update(
+            close_datetime=self.now + datetime.timedelta(days=1))
+        later = self.now + datetime.timedelta(minutes=1)
+        self.assertEqual(self.scheduler.settle(self.scheduler.due(later), later), 0)
+
+    def test_auto_bids_answer_before_settlement(self):
+        item = self.item(-1)
+        AutoBid.objects.create(made_by=self.users[1], item=item, max_bid_value=100)
+        with self.captureOnCommitCallbacks():
+            # its side effects haven't run yet
+            Bid.objects.create(made_by=self.users[0], item=item, value=50)
+        Bid.objects.filter(item=item).update(
+            created_date=self.now - datetime.timedelta(minutes=1, microseconds=1))
+        with mock.patch('api.scheduler.publish_close'):
+            self.assertEqual(self.scheduler.run_once(self.now), 1)
+        item.refresh_from_db()
+        self.assertEqual((item.winner, item.final_price),
+                         (self.users[1], decimal.Decimal('51')))
+
+    def test_earlier_close_datetime_is_rescheduled(self):
+        item = self.item(4)
+        self.scheduler.load(self.now)
+        Item.objects.filter(pk=item.pk).update(
+            close_datetime=self.now + datetime.timedelta(minutes=1))
+        self.scheduler.load(self.now)
+        self.assertEqual(self.scheduler.due(self.now + datetime.timedelta(minutes=1)),
+                         [item.id])
+        self.assertEqual(self.scheduler.due(self.now + datetime.timedelta(minutes=4)), [])
+
+    def test_bid_on_settled_item_is_rejected(self):
+        item = Item.objects.create(name='item', description='description',
+                                   close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC),
+                                   closed_at=self.now)
+        with self.assertRaises(exceptions.ValidationError):
+            BidService().place_bid(item, decimal.Decimal('12'), self.users[0])
+
+    def test_close_auctions_once(self):
+        Item.objects.create(name='item', description='description',
+                            close_datetime=datetime.datetime(2020, 1, 1, tzinfo=pytz.UTC))
+        out = StringIO()
+        call_command('close_auctions', '--once', stdout=out)
+        self.assertIn('1 auctions closed', out.getvalue())
+
+
+class StatsRollupTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user('user%d' % i, password='pass')
+                      for i in range(3)]
+        self.item = Item.objects.create(name='item', description='description')
+
+    def bid(self, value, user, minute):
+        bid = Bid.objects.create(made_by=user, item=self.item,
+                                 value=decimal.Decimal(value))
+        Bid.objects.filter(pk=bid.pk).update(created_date=datetime.datetime(
+            2021, 1, 1, 12, minute, 30, tzinfo=pytz.UTC))
+
+    def test_incremental_matches_full_rebuild(self):
+        rollup = StatsRollup(bucket_seconds=60)
+        rollup.batch_size = 3
+        values = []
+        for i in range(1, 12):
+            value = 10 + i * 1.5
+            values.append(decimal.Decimal(str(value)))
+            self.bid(str(value), self.users[i % 3 if i < 10 else 0], minute=i // 4)
+            stats = rollup.update(self.item.id)
+            ordered = sorted(values)
+            middle = len(ordered) // 2
+            median = (ordered[middle] if len(ordered) % 2 else
+                      (ordered[middle - 1] + ordered[middle]) / 2)
+            self.assertEqual(stats.median_value, median.quantize(decimal.Decimal('0.01')))
+        self.assertEqual((stats.bid_count, stats.bidder_count), (11, 3))
+        self.assertEqual(stats.max_value, decimal.Decimal('26.50'))
+        self.assertEqual(list(stats.buckets.values_list('bid_count', flat=True)),
+                         [3, 4, 4])
+
+        rebuilt = rollup.rebuild(self.item.id)
+        fields = ('bid_count', 'bidder_count', 'max_value', 'median_value',
+                  'first_bid_at', 'last_bid_at', 'last_bid_id')
+        self.assertEqual([getattr(rebuilt, f) for f in fields],
+                         [getattr(ItemStats.objects.get(), f) for f in fields])
+        self.assertEqual(ItemStatsBucket.objects.count(), 3)
+
+    def test_reads_only_new_bids(self):
+        rollup = StatsRollup()
+        self.bid('11', self.users[0], minute=0)
+        rollup.update(self.item.id)
+        self.bid('12', self.users[1], minute=1)
+        # savepoint, lock (3), new bids, bidders seen, buckets, a new
+        # bucket, median, the stats, release
+        with self.assertNumQueries(11):
+            rollup.update(self.item.id)
+        with self.assertNumQueries(6):
+            rollup.update(self.item.id)
+
+
+class StatsRollupConcurrencyTestCase(TransactionTestCase):
+    threads = 4
+
+    def rollup(self, item_id, barrier):
+        try:
+            barrier.wait()
+            StatsRollup().update(item_id)
+        finally:
+            connection.close()
+
+    def test_concurrent_rollups_count_each_bid_once(self):
+        users = [User.objects.create_user('user%d' % i, password='pass')
+                 for i in range(2)]
+        item = Item.objects.create(name='item', description='description')
+        # no signals, the rollups below are the only ones
+        Bid.objects.bulk_create(Bid(made_by=users[i % 2], item=item, value=10 + i)
+                                for i in range(20))
+        barrier = threading.Barrier(self.threads)
+        workers = [threading.Thread(target=self.rollup, args=(item.id, barrier))
+                   for _ in range(self.threads)]
+        with mock.patch.object(BidService, 'lock_attempts', 50):
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        stats = ItemStats.objects.get(item=item)
+        self.assertEqual((stats.bid_count, stats.bidder_count), (20, 2))
+        self.assertEqual(sum(stats.buckets.values_list('bid_count', flat=True)), 20)
+
+
+class BenchCommandTestCase(TestCase):
+    def test_bench_reports_each_scenario(self):
+        out = StringIO()
+        call_command('bench', items=20, users=20, requests=5, war_proxies=3,
+                     scenario=['item_list', 'search', 'autobid_war'], stdout=out)
+        report = json.loads(out.getvalue()[out.getvalue().index('{'):])
+        self.assertEqual(sorted(report['scenarios']), ['autobid_war', 'item_list', 'search'])
+        self.assertEqual(report['scenarios']['autobid_war']['errors'], 0)
+        self.assertFalse(Item.objects.exists())
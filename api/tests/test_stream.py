@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import decimal
+import json
+import threading
+import pytz
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+# internals
+from api.asgi import stream_router
+from api.models import Item, Bid
+from api.orderbook import get_order_books
+from api.stream import BroadcastHub, LocalBackend, get_hub
+
+
+async def not_found(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class BroadcastHubTestCase(SimpleTestCase):
+    def test_publish_from_another_thread_reaches_every_subscriber(self):
+        hub = BroadcastHub(LocalBackend())
+
+        async def watch():
+            subscriptions = [hub.subscribe(1) for _ in range(3)]
+            other = hub.subscribe(2)
+            threading.Thread(target=hub.publish,
+                             args=(1, {'value': decimal.Decimal('12')})).start()
+            payloads = [await asyncio.wait_for(s.__anext__(), 1)
+                        for s in subscriptions]
+            self.assertTrue(other.queue.empty())
+            for subscription in subscriptions + [other]:
+                subscription.close()
+            return payloads
+
+        payloads = asyncio.run(watch())
+        self.assertEqual(payloads, ['{"value":"12"}'] * 3)
+        self.assertEqual(hub.subscribers, {})
+
+    def test_slow_subscriber_keeps_newest_events(self):
+        hub = BroadcastHub(LocalBackend())
+        hub.queue_size = 2
+
+        async def watch():
+            subscription = hub.subscribe(1)
+            for value in range(5):
+                hub.publish(1, {'value': value})
+            await asyncio.sleep(0)
+            payloads = [subscription.queue.get_nowait() for _ in range(2)]
+            subscription.close()
+            return payloads
+
+        self.assertEqual(asyncio.run(watch()), ['{"value":3}', '{"value":4}'])
+
+
+class StreamRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.application = stream_router(not_found)
+
+    def test_websocket_receives_item_events(self):
+        async def watch():
+            communicator = ApplicationCommunicator(
+                self.application, {'type': 'websocket', 'path': '/ws/items/7/'})
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output(1))['type'],
+                             'websocket.accept')
+            get_hub().publish(7, {'type': 'bid', 'value': '5'})
+            message = await communicator.receive_output(1)
+            await communicator.send_input({'type': 'websocket.disconnect'})
+            await communicator.wait(1)
+            return message
+
+        message = asyncio.run(watch())
+        self.assertEqual(json.loads(message['text']), {'type': 'bid', 'value': '5'})
+
+    def test_sse_receives_item_events(self):
+        async def watch():
+            communicator = ApplicationCommunicator(self.application, {
+                'type': 'http', 'method': 'GET',
+                'path': '/api/v1/items/7/stream/'})
+            start = await communicator.receive_output(1)
+            get_hub().publish(7, {'type': 'close'})
+            body = await communicator.receive_output(1)
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(1)
+            return start, body
+
+        start, body = asyncio.run(watch())
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertEqual(body['body'], b'data: {"type":"close"}\n\n')
+
+    def test_other_requests_go_to_django(self):
+        async def request():
+            communicator = ApplicationCommunicator(self.application, {
+                'type': 'http', 'method': 'GET', 'path': '/api/v1/items/'})
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(1)
+
+        self.assertEqual(asyncio.run(request())['status'], 404)
+
+
+@override_settings(BID_DISPATCH_EAGER=True)
+class BidEventTestCase(TestCase):
+    def setUp(self):
+        get_order_books().clear()
+
+    def test_bid_is_published_after_commit(self):
+        user = User.objects.create_user('user', password='pass')
+        item = Item.objects.create(name='item', description='description',
+                                   close_datetime=datetime.datetime(2071, 1, 1, tzinfo=pytz.UTC))
+        published = []
+
+        def listener(channel, payload):
+            published.append((channel, json.loads(payload)))
+        get_hub().backend.add_listener(listener)
+        self.addCleanup(get_hub().backend.listeners.remove, listener)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bid = Bid.objects.create(made_by=user, item=item,
+                                     value=decimal.Decimal('12'))
+            self.assertEqual(published, [])
+        self.assertEqual(published, [(str(item.id), {
+            'type': 'bid', 'item': item.id, 'bid': bid.id,
+            'value': '12', 'made_by': user.id})])
@@ -1,12 +1,40 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils.http import http_date
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+import base64
 import decimal
 import datetime
+import io
+import json
+import os
 import pytz
+import shutil
+import tempfile
+import time
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from PIL import Image as PILImage
 # internals
 from api.models import *
+from api.serializers import ItemDetailSerializer
+from api.pagiantion import CustomPagination
+from api.orderbook import get_order_books
+from api.views import BidViewSet
+from api.authentication import CachedJWTAuthentication, get_user_cache
+from api.metrics import get_registry
+from api.cache import check_shared_cache, item_version
+from api.throttling import CacheBuckets, get_bid_buckets
+from api.renderers import FastJSONRenderer, orjson
+from rest_framework.renderers import JSONRenderer
 
 
 def create_superuser(username='adnan',
@@ -30,8 +58,32 @@ class CustomTokenObtainPairViewTestCase(TestCase):
         self.assertContains(response, 'access')
 
 
+class CachedJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = create_superuser()
+        self.token = AccessToken.for_user(self.user)
+        self.authentication = CachedJWTAuthentication()
+
+    def test_user_is_read_once(self):
+        with self.assertNumQueries(1):
+            user = self.authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            cached = self.authentication.get_user(self.token)
+        self.assertEqual(cached, user)
+        self.assertIsNot(cached, user)
+
+    def test_deactivated_user_is_evicted(self):
+        self.authentication.get_user(self.token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+
 class ItemGenerateMixin(object):
     def setUpUser(self):
+        get_bid_buckets().clear()
         self.user = create_superuser()
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
@@ -79,6 +131,119 @@ class ItemViewSetTestCase(TestCase, ItemGenerateMixin):
         self.assertEqual(response['name'], 'item new')
         self.assertEqual(response['id'], Item.objects.last().id)
 
+    def test_item_list_cursor(self):
+        Item.objects.create(name='item3', description='no close date')
+        for day in range(3, 28):
+            Item.objects.create(name='item%d' % day, description='description',
+                                close_datetime=datetime.datetime(2071, 1, day, tzinfo=pytz.UTC))
+        url = self.item_list_url + '?cursor='
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            response = response.json()
+            self.assertNotIn('count', response)
+            ids += [item['id'] for item in response['results']]
+            url = response['next']
+        expected = list(Item.objects.filter(close_datetime__isnull=False)
+                        .values_list('id', flat=True))
+        expected += list(Item.objects.filter(close_datetime__isnull=True)
+                         .values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_item_list_cursor_keeps_microseconds(self):
+        close = datetime.datetime(2071, 1, 1, 0, 0, 0, 123456, tzinfo=pytz.UTC)
+        created = [Item.objects.create(name='item%d' % i, description='description',
+                                       close_datetime=close + datetime.timedelta(
+                                           microseconds=i // 3)).id
+                   for i in range(5)]
+        url = self.item_list_url + '?cursor=&limit=2'
+        ids = []
+        while url and len(ids) <= 10:
+            response = self.client.get(url).json()
+            ids += [item['id'] for item in response['results']]
+            url = response['next']
+        self.assertEqual([pk for pk in ids if pk in created], created)
+
+    def test_item_list_invalid_cursor(self):
+        for position in (['notadate', 1], ['2071-01-01T00:00:00Z', 'x'], 'x'):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get(self.item_list_url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_item_list_approximate_count(self):
+        response = self.client.get(self.item_list_url, {'count': 'approx'})
+        self.assertEqual(response.json()['count'], 2)
+        response = self.client.get(self.item_list_url,
+                                   {'cursor': '', 'count': 'approx'})
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_item_list_no_page_is_capped(self):
+        with mock.patch.object(CustomPagination, 'no_page_max_size', 1):
+            response = self.client.get(self.item_list_url, {'noPage': ''})
+        self.assertEqual(len(response.json()), 1)
+
+    def test_item_list_num_queries(self):
+        for item in Item.objects.all():
+            Image.objects.create(path='a.png', item=item)
+            Image.objects.create(path='b.png', item=item)
+        # count, items, images
+        with self.assertNumQueries(3):
+            response = self.client.get(self.item_list_url)
+        self.assertEqual(len(response.json()['results'][0]['images']), 2)
+
+    def test_item_retrieve_num_queries(self):
+        item = Item.objects.get(pk=2)
+        Image.objects.create(path='a.png', item=item)
+        for i in range(5):
+            user = create_superuser('user%d' % i, 'user%d@kaya.com' % i)
+            Bid.objects.create(value=item.price + i, made_by=user, item=item)
+        # item, images, bids with their users
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api:items-detail', args=[item.id]))
+        self.assertEqual(len(response.json()['bids']), 5)
+
+    def create_bids(self, item, count):
+        for i in range(count):
+            user = create_superuser('user%d' % i, 'user%d@kaya.com' % i)
+            Bid.objects.create(value=item.price + i, made_by=user, item=item)
+
+    def test_item_retrieve_embeds_recent_bids(self):
+        item = Item.objects.get(pk=2)
+        self.create_bids(item, ItemDetailSerializer.recent_bids_limit + 5)
+        response = self.client.get(reverse('api:items-detail', args=[item.id]))
+        bids = response.json()['bids']
+        self.assertEqual(len(bids), ItemDetailSerializer.recent_bids_limit)
+        self.assertEqual(decimal.Decimal(bids[0]['value']),
+                         item.price + ItemDetailSerializer.recent_bids_limit + 4)
+
+    def test_item_bids_cursor_pagination(self):
+        item = Item.objects.get(pk=2)
+        self.create_bids(item, 25)
+        url = reverse('api:items-bids', args=[item.id]) + '?limit=10'
+        values = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            response = response.json()
+            values += [decimal.Decimal(bid['value']) for bid in response['results']]
+            url = response['next']
+        self.assertEqual(values, [item.price + i for i in reversed(range(25))])
+
+    def test_item_bids_cursor_ties_are_keyed_on_id(self):
+        item = Item.objects.get(pk=2)
+        self.create_bids(item, 7)
+        item.bids.update(created_date=datetime.datetime(2021, 1, 1, tzinfo=pytz.UTC))
+        url = reverse('api:items-bids', args=[item.id]) + '?limit=3'
+        values = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url).json()
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+            values += [decimal.Decimal(bid['value']) for bid in response['results']]
+            url = response['next']
+        self.assertEqual(values, [item.price + i for i in reversed(range(7))])
+
     def test_item_update(self):
         item1_payload = {'name': 'item1 new', 'description': 'description item1 new',
                          'price': decimal.Decimal('150'),
@@ -141,6 +306,74 @@ class ImageViewSetTestCase(TestCase, ItemGenerateMixin):
         self.assertEqual(first_image.item_id, 2)
 
 
+@override_settings(IMAGE_VARIANT_EAGER=True, IMAGE_VARIANT_WIDTHS=[320, 640])
+class ImageVariantsTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        self.setUpUser()
+        self.create_items()
+
+    def png(self, size=(1000, 500)):
+        data = io.BytesIO()
+        PILImage.new('RGBA', size, (200, 10, 10, 128)).save(data, 'PNG')
+        return SimpleUploadedFile('photo.PNG', data.getvalue(), 'image/png')
+
+    def upload(self, size=(1000, 500)):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('api:images-list'),
+                                        {'item': self.item2.id, 'file': self.png(size)})
+        self.assertEqual(response.status_code, 201)
+        return Image.objects.get(pk=response.json()['id'])
+
+    def test_upload_renders_variants(self):
+        image = self.upload()
+        self.assertTrue(image.path.startswith(f'images/{self.item2.id}/'))
+        self.assertEqual((image.width, image.height), (1000, 500))
+        self.assertEqual(sorted((v['format'], v['width'], v['height']) for v in image.variants),
+                         [('jpeg', 320, 160), ('jpeg', 640, 320),
+                          ('webp', 320, 160), ('webp', 640, 320)])
+        for variant in image.variants:
+            with PILImage.open(os.path.join(self.media_root, variant['path'])) as f:
+                self.assertEqual(f.size, (variant['width'], variant['height']))
+
+    def test_item_exposes_sources(self):
+        image = self.upload()
+        response = self.client.get(reverse('api:items-detail', args=[self.item2.id]))
+        images = response.json()['images']
+        self.assertEqual(images[0]['width'], 1000)
+        webp, jpeg = images[0]['sources']
+        self.assertEqual(webp['type'], 'image/webp')
+        self.assertEqual(jpeg['type'], 'image/jpeg')
+        small, large = webp['srcset'].split(', ')
+        self.assertTrue(small.startswith('/media/images/') and small.endswith(' 320w'))
+        self.assertTrue(large.endswith(' 640w'))
+
+    def test_small_image_is_not_upscaled(self):
+        image = self.upload(size=(200, 100))
+        self.assertEqual({v['width'] for v in image.variants}, {200})
+
+    def test_path_without_file_is_left_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('api:images-list'),
+                                        {'item': self.item2.id, 'path': 'http://cdn/x.png'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Image.objects.get().variants, [])
+
+    def test_backfill(self):
+        image = self.upload()
+        Image.objects.update(width=None, height=None, variants=[])
+        out = io.StringIO()
+        call_command('render_image_variants', workers=1, stdout=out)
+        self.assertIn('1 images rendered, 0 failed', out.getvalue())
+        image.refresh_from_db()
+        self.assertEqual(len(image.variants), 4)
+
+
 class BidViewSetTestCase(TestCase, ItemGenerateMixin):
     def setUp(self):
         self.setUpUser()
@@ -195,6 +428,108 @@ class BidViewSetTestCase(TestCase, ItemGenerateMixin):
         self.assertEqual(decimal.Decimal(response.get('value')),
                          payload_success.get('value'))
 
+    def test_bulk_bids_are_applied_in_order(self):
+        user2 = create_superuser('admin', 'admin@kaya.com', 'password')
+        bulk_url = reverse('api:bids-bulk')
+        payload = [
+            {'item': self.item2.id, 'made_by': user2.id, 'value': '30'},
+            {'item': self.item2.id, 'made_by': self.user.id, 'value': '29'},
+            {'item': self.item2.id, 'made_by': self.user.id, 'value': '31'},
+            {'item': self.item1.id, 'made_by': user2.id, 'value': '50'},
+            {'item': 999, 'made_by': user2.id, 'value': '50'},
+            {'item': self.item2.id, 'made_by': user2.id},
+        ]
+        with mock.patch('api.receivers.dispatch_on_commit') as dispatch:
+            response = self.client.post(bulk_url, data=payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = response.json()
+        self.assertEqual((response['accepted'], response['rejected']), (2, 4))
+        self.assertEqual([r['status'] for r in response['results']],
+                         ['accepted', 'rejected', 'accepted',
+                          'rejected', 'rejected', 'rejected'])
+        self.assertIn('higher', response['results'][1]['error'])
+        self.assertIn('late', response['results'][3]['error'])
+        self.assertIn('value', response['results'][5]['errors'])
+
+        accepted = [response['results'][0]['id'], response['results'][2]['id']]
+        self.assertEqual(list(Bid.objects.filter(pk__in=accepted).order_by('value')
+                              .values_list('made_by', 'value')),
+                         [(user2.id, decimal.Decimal('30')),
+                          (self.user.id, decimal.Decimal('31'))])
+        item = Item.objects.get(pk=self.item2.pk)
+        self.assertEqual((item.current_bid_value, item.current_bidder, item.bid_count),
+                         (decimal.Decimal('31'), self.user, 3))
+        self.assertEqual([call.args[1].id for call in dispatch.call_args_list], accepted)
+
+    def test_bulk_bids_ndjson(self):
+        user2 = create_superuser('admin', 'admin@kaya.com', 'password')
+        lines = [f'{{"item": {self.item2.id}, "made_by": {user}, "value": {value}}}'
+                 for value in range(30, 130)
+                 for user in [(user2.id, self.user.id)[value % 2]]]
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse('api:bids-bulk'),
+                                        data='\n'.join(lines) + '\n',
+                                        content_type='application/x-ndjson')
+        self.assertEqual(response.json()['accepted'], 100)
+        self.assertEqual(Item.objects.get(pk=self.item2.pk).bid_count, 101)
+
+    def test_bid_create_with_idempotency_key_is_replayed(self):
+        cache.clear()
+        user2 = create_superuser('admin', 'admin@kaya.com', 'password')
+        payload = {'value': '40', 'item': self.item2.id, 'made_by': user2.id}
+        first = self.client.post(self.bid_list_url, data=payload,
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.client.post(self.bid_list_url, data=payload,
+                                     HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Bid.objects.filter(item=self.item2, made_by=user2).count(), 1)
+
+        other = self.client.post(self.bid_list_url, data=dict(payload, value='50'),
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(other.status_code, 422)
+
+    def test_rejected_bid_is_replayed(self):
+        cache.clear()
+        payload = {'value': '1', 'item': self.item2.id, 'made_by': self.user.id}
+        first = self.client.post(self.bid_list_url, data=payload,
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(first.status_code, 400)
+        with self.assertNumQueries(0):
+            retry = self.client.post(self.bid_list_url, data=payload,
+                                     HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual((retry.status_code, retry.json()), (400, first.json()))
+
+    def test_anonymous_idempotency_keys_are_per_client(self):
+        cache.clear()
+        self.client.force_authenticate(user=None)
+        payload = {'value': '1', 'item': self.item2.id, 'made_by': self.user.id}
+        first = self.client.post(self.bid_list_url, data=payload,
+                                 HTTP_IDEMPOTENCY_KEY='abc', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(first.status_code, 400)
+        other = self.client.post(self.bid_list_url, data=payload,
+                                 HTTP_IDEMPOTENCY_KEY='abc', REMOTE_ADDR='10.0.0.2')
+        self.assertNotIn('Idempotent-Replayed', other)
+        retry = self.client.post(self.bid_list_url, data=payload,
+                                 HTTP_IDEMPOTENCY_KEY='abc', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_idempotency_key_in_flight(self):
+        cache.clear()
+        view = BidViewSet()
+        store = view.get_idempotency_store()
+        store.begin(store.cache_key(f'user-{self.user.pk}', self.bid_list_url, 'abc'))
+        response = self.client.post(self.bid_list_url, data={}, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 409)
+
+    def test_bulk_bids_expects_a_list(self):
+        response = self.client.post(reverse('api:bids-bulk'),
+                                    data={'item': self.item2.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
 
 class AutoBidViewSetTestCase(TestCase, ItemGenerateMixin):
     def setUp(self):
@@ -219,6 +554,11 @@ class AutoBidViewSetTestCase(TestCase, ItemGenerateMixin):
         self.assertEqual(len(response), 2)
         self.assertTrue(all(bool(bid.get('item_name')) for bid in response))
 
+    def test_autobids_list_num_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.autobid_list_url)
+        self.assertEqual(len(response.json()), 2)
+
     def test_autobid_receive(self):
         response = self.client.get(self.autobid_receive_url)
         self.assertEqual(response.status_code, 200)
@@ -260,3 +600,451 @@ class AutoBidViewSetTestCase(TestCase, ItemGenerateMixin):
         self.assertEqual(decimal.Decimal(response.get(
             'max_bid_value')), decimal.Decimal(300))
         
+
+
+@override_settings(BID_THROTTLE_RATES={'user': '4/min', 'user_item': '2/min',
+                                       'bulk': '6/min', 'bulk_item': '3/min'})
+class BidThrottleTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        self.setUpUser()
+        self.create_items()
+        self.user2 = User.objects.create_user('user2', password='pass')
+        self.bid_list_url = reverse('api:bids-list')
+
+    def bid(self, value, item=None, made_by=None):
+        # throttled as the authenticated user, whoever the bid is made by
+        return self.client.post(self.bid_list_url, {
+            'item': (item or self.item2).id, 'made_by': (made_by or self.user).id,
+            'value': value})
+
+    def test_user_and_item_buckets(self):
+        self.assertEqual(self.bid('30').status_code, 201)
+        self.assertEqual(self.bid('20').status_code, 400)
+        with self.assertNumQueries(0):
+            response = self.bid('40')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # the other item has its own bucket, the user's is shared
+        self.assertEqual(self.bid('50', self.item1).status_code, 400)
+        response = self.client.post(reverse('api:autobids-list'), {
+            'item': self.item1.id, 'made_by': self.user.id, 'max_bid_value': '90'})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(self.bid_list_url, {'value': '60'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '15')
+        self.assertEqual(self.client.get(self.bid_list_url).status_code, 200)
+
+    def test_item_rejections_keep_user_tokens(self):
+        self.bid('30')
+        self.bid('31', made_by=self.user2)
+        for value in range(32, 40):
+            self.assertEqual(self.bid(str(value)).status_code, 429)
+        self.assertEqual(self.bid('50', self.item1).status_code, 400)
+        self.assertEqual(self.bid('51', self.item1).status_code, 400)
+        self.assertEqual(self.bid('52', self.item1).status_code, 429)
+
+    def test_buckets_refill(self):
+        with mock.patch('api.throttling.time.monotonic', return_value=1000):
+            self.bid('30')
+            self.bid('31', made_by=self.user2)
+            self.assertEqual(self.bid('32').status_code, 429)
+        with mock.patch('api.throttling.time.monotonic', return_value=1030):
+            self.assertEqual(self.bid('32').status_code, 201)
+            self.assertEqual(self.bid('33', made_by=self.user2).status_code, 429)
+
+    def test_idempotent_replays_take_no_tokens(self):
+        cache.clear()
+        payload = {'item': self.item2.id, 'made_by': self.user.id, 'value': '30'}
+        first = self.client.post(self.bid_list_url, payload, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(first.status_code, 201)
+        for _ in range(3):
+            retry = self.client.post(self.bid_list_url, payload, HTTP_IDEMPOTENCY_KEY='abc')
+            self.assertEqual(retry.status_code, 201)
+            self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.bid('31', made_by=self.user2).status_code, 201)
+
+    def test_bulk_takes_a_token_per_bid(self):
+        url = reverse('api:bids-bulk')
+
+        def bulk(item, *values):
+            return self.client.post(url, format='json', data=[
+                {'item': item.id, 'made_by': (self.user, self.user2)[i % 2].id,
+                 'value': value} for i, value in enumerate(values)])
+
+        self.assertEqual(bulk(self.item2, 30, 31, 32).json()['accepted'], 3)
+        response = bulk(self.item2, 33)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertEqual(bulk(self.item1, 50, 51).status_code, 200)
+        self.assertEqual(bulk(self.item1, 52).status_code, 200)
+        # the user's bulk bucket alone
+        response = self.client.post(url, data=[{'item': 'x'}], format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        # the bids' own buckets are untouched
+        self.assertEqual(self.bid('40', made_by=self.user2).status_code, 201)
+
+    def test_bulk_over_a_bucket_is_rejected(self):
+        response = self.client.post(reverse('api:bids-bulk'), format='json', data=[
+            {'item': self.item2.id, 'made_by': self.user.id, 'value': 30 + i}
+            for i in range(4)])
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('Retry-After', response)
+
+    def test_cache_buckets(self):
+        cache.clear()
+        with mock.patch('api.throttling._buckets', CacheBuckets()):
+            self.assertEqual(self.bid('30').status_code, 201)
+            self.assertEqual(self.bid('31', made_by=self.user2).status_code, 201)
+            self.assertEqual(self.bid('32').status_code, 429)
+            self.assertTrue(cache.get(f'throttle:bid:user-{self.user.id}'))
+
+
+class ExportTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        self.setUpUser()
+        self.create_items()
+        self.user2 = User.objects.create_user('user2', password='pass')
+        self.bids = [Bid.objects.create(value=self.item2.price + i, item=self.item2,
+                                        made_by=(self.user, self.user2)[i % 2])
+                     for i in range(1, 6)]
+        Bid.objects.filter(pk=self.bids[0].pk).update(
+            created_date=datetime.datetime(2021, 1, 1, tzinfo=pytz.UTC))
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_bids_csv(self):
+        response = self.client.get(reverse('api:bids-export'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('bids.csv', response['Content-Disposition'])
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0], 'id,item_id,made_by_id,value,created_date')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].startswith(f'{self.bids[0].id},{self.item2.id},'
+                                            f'{self.user2.id},26.00,2021-01-01T00:00:00'))
+
+    def test_bids_ndjson_filtered(self):
+        response = self.client.get(reverse('api:bids-export'), {
+            'format': 'ndjson', 'item': self.item2.id, 'made_by': self.user2.id,
+            'since': '2022-01-01T00:00:00Z'})
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [self.bids[2].id, self.bids[4].id])
+        self.assertEqual(rows[0]['value'], '28.00')
+
+    def test_items_closed(self):
+        Item.objects.filter(pk=self.item1.pk).update(
+            closed_at=datetime.datetime(2021, 1, 1, 6, tzinfo=pytz.UTC))
+        response = self.client.get(reverse('api:items-export'),
+                                   {'closed': 'true'}, HTTP_ACCEPT='application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.item1.id])
+
+    def test_invalid_filter(self):
+        response = self.client.get(reverse('api:bids-export'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export', 'bids', '--format', 'ndjson', '--made-by',
+                     str(self.user.id), stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        with self.assertRaises(CommandError):
+            call_command('export', 'items', '--since', 'yesterday')
+
+
+class SparseFieldsetsTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        cache.clear()
+        self.setUpUser()
+        self.create_items()
+        self.user2 = User.objects.create_user('user2', password='pass')
+        Image.objects.create(item=self.item2, path='images/a.png', width=640, height=320,
+                             variants=[{'format': 'webp', 'width': 320, 'height': 160,
+                                        'path': 'images/a-320.webp'}])
+        Image.objects.create(item=self.item2, path='images/b.png')
+        for i in range(1, 4):
+            Bid.objects.create(value=self.item2.price + i, item=self.item2,
+                               made_by=(self.user, self.user2)[i % 2])
+        AutoBid.objects.create(made_by=self.user, item=self.item2,
+                               max_bid_value=decimal.Decimal('100.50'))
+
+    def assertSameAsInstances(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        with override_settings(API_VALUES_LISTS=False):
+            expected = self.client.get(url, params).json()
+        self.assertEqual(response.json(), expected)
+        return expected
+
+    def test_values_lists_match_instances(self):
+        items = reverse('api:items-list')
+        page = self.assertSameAsInstances(items)
+        self.assertEqual(page['results'][1]['images'][0]['sources'],
+                         [{'type': 'image/webp', 'srcset': '/media/images/a-320.webp 320w'}])
+        page = self.assertSameAsInstances(items, {'cursor': '', 'limit': 1})
+        self.assertSameAsInstances(page['next'])
+        self.assertSameAsInstances(items, {'noPage': ''})
+        self.assertSameAsInstances(reverse('api:bids-list'))
+        self.assertSameAsInstances(reverse('api:autobids-list'))
+
+    def test_fields_and_omit(self):
+        response = self.client.get(reverse('api:items-list'), {'fields': 'id,name,x'})
+        self.assertEqual([list(item) for item in response.json()['results']],
+                         [['id', 'name'], ['id', 'name']])
+        response = self.client.get(reverse('api:bids-list'), {'omit': 'created_date,made_by'})
+        self.assertEqual(list(response.json()[0]), ['id', 'item', 'value'])
+        response = self.client.get(reverse('api:autobids-list'),
+                                   {'fields': 'id,item_name', 'omit': 'id'})
+        self.assertEqual(response.json(), [{'item_name': 'item2'}])
+        with override_settings(API_VALUES_LISTS=False):
+            response = self.client.get(reverse('api:bids-list'), {'fields': 'value'})
+        self.assertEqual(list(response.json()[0]), ['value'])
+
+    def test_omitted_images_are_not_read(self):
+        url = reverse('api:items-list')
+        for values_lists in (True, False):
+            with override_settings(API_VALUES_LISTS=values_lists):
+                # COUNT(*) and the page
+                with self.assertNumQueries(2):
+                    self.client.get(url, {'omit': 'images'})
+                with self.assertNumQueries(3):
+                    self.client.get(url)
+
+    def test_detail_narrowed_after_cache(self):
+        url = reverse('api:items-detail', args=[self.item2.id])
+        response = self.client.get(url, {'fields': 'id,max_bid_value'})
+        self.assertEqual(response.json(), {'id': self.item2.id, 'max_bid_value': '28.00'})
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()['bids']), 3)
+        self.assertIn('description', response.json())
+
+    def test_writes_see_every_field(self):
+        response = self.client.post(reverse('api:bids-list') + '?fields=id', {
+            'item': self.item2.id, 'made_by': self.user.id, 'value': '40.00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['value'], '40.00')
+
+    def test_fast_json_renderer(self):
+        data = self.client.get(reverse('api:items-list')).data
+        rendered = FastJSONRenderer().render(data, 'application/json')
+        self.assertEqual(json.loads(rendered),
+                         json.loads(JSONRenderer().render(data, 'application/json')))
+        if orjson is None:
+            self.assertEqual(rendered, JSONRenderer().render(data, 'application/json'))
+        self.assertEqual(FastJSONRenderer().render(
+            {'at': datetime.datetime(2021, 1, 1, tzinfo=pytz.UTC), 's': '\u2028'},
+            'application/json'), b'{"at":"2021-01-01T00:00:00Z","s":"\\u2028"}')
+        self.assertIn(b'\n    ', FastJSONRenderer().render(
+            {'a': 1}, 'application/json; indent=4'))
+
+
+@override_settings(BID_DISPATCH_EAGER=True)
+class ItemStatsTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        get_order_books().clear()
+        self.setUpUser()
+        self.create_items()
+        self.user2 = User.objects.create_user('user2', password='pass')
+        for i, user in enumerate((self.user, self.user2, self.user, self.user2), 1):
+            with self.captureOnCommitCallbacks(execute=True):
+                Bid.objects.create(value=self.item2.price + i, item=self.item2,
+                                   made_by=user)
+
+    def test_stats(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api:items-stats', args=[self.item2.id]))
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()
+        self.assertEqual(stats['bid_count'], 4)
+        self.assertEqual(stats['bidder_count'], 2)
+        self.assertEqual(stats['max_value'], '29.00')
+        self.assertEqual(stats['median_value'], '27.50')
+        self.assertEqual(stats['bids_per_minute'], 4.0)
+        self.assertEqual(sum(bucket['bid_count'] for bucket in stats['series']), 4)
+        self.assertEqual(stats['series'][-1]['close_value'], '29.00')
+
+    def test_item_without_bids(self):
+        response = self.client.get(reverse('api:items-stats', args=[self.item1.id]))
+        self.assertEqual(response.json()['bid_count'], 0)
+        self.assertEqual(response.json()['series'], [])
+        response = self.client.get(reverse('api:items-stats', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_stats(self):
+        url = reverse('api:items-bulk-stats')
+        response = self.client.get(url, {'ids': f'{self.item2.id},999,{self.item1.id}'})
+        self.assertEqual([stats['item'] for stats in response.json()],
+                         [self.item2.id, self.item1.id])
+        self.assertEqual(self.client.get(url, {'ids': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class ItemSearchTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        self.setUpUser()
+        self.create_items()
+        self.item_list_url = reverse('api:items-list')
+
+    def search(self, query):
+        response = self.client.get(self.item_list_url, {'query': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()['results']]
+
+    def test_search_prefix_and_ranking(self):
+        Item.objects.create(name='vintage camera', description='a leica')
+        Item.objects.create(name='tripod', description='fits any camera')
+        self.assertEqual(self.search('cam'), ['vintage camera', 'tripod'])
+        self.assertEqual(self.search('vintage cam'), ['vintage camera'])
+
+    def test_search_follows_item_updates(self):
+        self.assertEqual(self.search('item1'), ['item1'])
+        self.item1.name = 'renamed'
+        self.item1.description = 'description'
+        self.item1.save()
+        self.assertEqual(self.search('item1'), [])
+        self.assertEqual(self.search('renamed'), ['renamed'])
+        self.item1.delete()
+        self.assertEqual(self.search('renamed'), [])
+
+    def test_search_ignores_punctuation(self):
+        self.assertEqual(self.search('"item2*'), ['item2'])
+        self.assertEqual(len(self.search('!!')), 2)
+
+
+class ItemDetailCacheTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        cache.clear()
+        get_order_books().clear()
+        self.setUpUser()
+        self.create_items()
+        self.item_retrieve_url = reverse('api:items-detail', args=[self.item2.id])
+
+    def test_cached_detail_is_served_without_queries(self):
+        first = self.client.get(self.item_retrieve_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.item_retrieve_url)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertNotIn('Last-Modified', second)
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.item_retrieve_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.item_retrieve_url,
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_narrowed_detail_has_its_own_etag(self):
+        etag = self.client.get(self.item_retrieve_url)['ETag']
+        narrowed = self.client.get(self.item_retrieve_url, {'fields': 'id,name'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(narrowed.status_code, 200)
+        self.assertEqual(list(narrowed.json()), ['id', 'name'])
+        self.assertNotEqual(narrowed['ETag'], etag)
+        omitted = self.client.get(self.item_retrieve_url, {'omit': 'bids'},
+                                  HTTP_IF_NONE_MATCH=narrowed['ETag'])
+        self.assertEqual(omitted.status_code, 200)
+        response = self.client.get(self.item_retrieve_url, {'fields': 'name,id'},
+                                   HTTP_IF_NONE_MATCH=narrowed['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_item_is_never_not_modified(self):
+        response = self.client.get(reverse('api:items-detail', args=[999]),
+                                   HTTP_IF_NONE_MATCH=f'"999-{item_version(999)}"')
+        self.assertEqual(response.status_code, 404)
+
+    def test_bid_in_the_same_second_is_not_hidden(self):
+        first = self.client.get(self.item_retrieve_url)
+        self.assertNotIn('Last-Modified', first)
+        with self.settings(BID_DISPATCH_EAGER=True), \
+                self.captureOnCommitCallbacks(execute=True):
+            Bid.objects.create(value=self.item2.price + 1, made_by=self.user,
+                               item=self.item2)
+        response = self.client.get(self.item_retrieve_url,
+                                   HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['bids']), 1)
+
+    def test_bid_invalidates_detail(self):
+        etag = self.client.get(self.item_retrieve_url)['ETag']
+        with self.settings(BID_DISPATCH_EAGER=True), \
+                self.captureOnCommitCallbacks(execute=True):
+            Bid.objects.create(value=self.item2.price + 1, made_by=self.user,
+                               item=self.item2)
+        response = self.client.get(self.item_retrieve_url,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['bids']), 1)
+
+    def test_workers_need_a_shared_cache(self):
+        with self.settings(WEB_WORKERS=2):
+            with self.assertRaises(ImproperlyConfigured):
+                check_shared_cache()
+            with self.settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache'}}):
+                check_shared_cache()
+        check_shared_cache()
+
+    def test_image_invalidates_detail(self):
+        self.client.get(self.item_retrieve_url)
+        Image.objects.create(path='a.png', item=self.item2)
+        response = self.client.get(self.item_retrieve_url)
+        self.assertEqual(len(response.json()['images']), 1)
+
+
+class MetricsTestCase(TestCase, ItemGenerateMixin):
+    def setUp(self):
+        get_registry().reset()
+        self.setUpUser()
+        self.create_items()
+
+    def test_requests_are_counted_per_view(self):
+        self.client.get(reverse('api:items-list'))
+        self.client.get(reverse('api:items-list'))
+        stats = get_registry().stats[('api:items-list', 'GET')]
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(stats.queries, 6)
+        self.assertGreater(stats.serializer_time, 0)
+
+        response = self.client.get(reverse('api:metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('http_requests_total{view="api:items-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{view="api:items-list",method="GET"} 2', body)
+        self.assertIn('http_request_db_queries_total{view="api:items-list",method="GET"} 6', body)
+
+    @override_settings(METRICS_SLOW_THRESHOLD=0)
+    def test_slow_requests_are_sampled_with_their_sql(self):
+        self.client.get(reverse('api:items-detail', args=[self.item1.id]))
+        response = self.client.get(reverse('api:metrics-slow'))
+        self.assertEqual(response.status_code, 200)
+        sample = response.json()[0]
+        self.assertEqual(sample['view'], 'api:items-detail')
+        self.assertEqual(len(sample['sql']), sample['queries'])
+        self.assertIn('t_item', sample['sql'][0]['sql'])
+
+    def test_metrics_are_for_staff_and_allowed_scrapers(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(reverse('api:metrics')).status_code, 401)
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(reverse('api:metrics')).status_code, 200)
+
+    def test_streaming_response_is_recorded_once_streamed(self):
+        Bid.objects.create(value=self.item2.price + 1, made_by=self.user, item=self.item2)
+        response = self.client.get(reverse('api:bids-export'))
+        self.assertNotIn(('api:bids-export', 'GET'), get_registry().stats)
+        b''.join(response.streaming_content)
+        stats = get_registry().stats[('api:bids-export', 'GET')]
+        self.assertEqual(stats.count, 1)
+        self.assertGreaterEqual(stats.queries, 1)
+
+    def test_slow_requests_are_staff_only(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('api:metrics-slow'))
+        self.assertEqual(response.status_code, 401)
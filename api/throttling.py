@@ -0,0 +1,173 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """
+    '20/min' -> (20, 20 / 60): a bucket of 20 tokens refilled at one
+    every 3 seconds, so bursts of up to 20 requests.
+    """
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+def take_tokens(states, costs, now):
+    """
+    Takes the `costs`, (key, capacity, rate, cost), from all their buckets
+    or, when one of them is short, from none. `states` are the buckets by
+    key, (tokens, at), None for a full one. Returns the new states (None
+    when nothing was taken) and the seconds to wait: 0 when taken, None
+    when a cost is over its bucket's capacity and can never be taken.
+    """
+    taken, wait = {}, 0
+    for key, capacity, rate, cost in costs:
+        if cost > capacity:
+            return None, None
+        state = states.get(key)
+        tokens = capacity if state is None else min(
+            capacity, state[0] + (now - state[1]) * rate)
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / rate)
+        taken[key] = (tokens - cost, now)
+    if wait:
+        return None, wait
+    return taken, 0
+
+
+class LocalBuckets(object):
+    """
+    Token buckets of this process, the `max_size` most recently used
+    ones. With several workers each enforces the rates on its own.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or settings.BID_THROTTLE_MAX_KEYS
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, costs):
+        """
+        See take_tokens, returns the seconds to wait.
+        """
+        with self.lock:
+            taken, wait = take_tokens(
+                {key: self.buckets.get(key) for key, *_ in costs},
+                costs, time.monotonic())
+            for key, state in (taken or {}).items():
+                self.buckets[key] = state
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_size:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBuckets(object):
+    """
+    Token buckets in the BID_THROTTLE_CACHE cache, shared by the workers.
+    Like DRF's throttles it reads and writes without a lock, concurrent
+    requests for one bucket may let a few more through. A bucket expires
+    once it would be full again.
+    """
+    key_prefix = 'throttle:'
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or settings.BID_THROTTLE_CACHE]
+
+    def take(self, costs):
+        """
+        See take_tokens, returns the seconds to wait.
+        """
+        costs = [(self.key_prefix + key, capacity, rate, cost)
+                 for key, capacity, rate, cost in costs]
+        taken, wait = take_tokens(
+            self.cache.get_many([key for key, *_ in costs]), costs, time.time())
+        if taken:
+            self.cache.set_many(taken, max(
+                math.ceil(capacity / rate) + 1 for _, capacity, rate, _ in costs))
+        return wait
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_bid_buckets():
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                _buckets = import_string(settings.BID_THROTTLE_BACKEND)()
+    return _buckets
+
+
+class BidThrottle(BaseThrottle):
+    """
+    Token buckets of BID_THROTTLE_RATES: a bid takes a token from the
+    user's bucket and one from the user and item's, a bulk placement one
+    per bid from the user's 'bulk' bucket and from its 'bulk_item' ones.
+    The tokens are taken from all of them or, when one is short, from
+    none. A bulk over a bucket's size is always rejected, without a
+    Retry-After. Scopes without a rate aren't throttled.
+    """
+
+    def get_user_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return f'anon-{self.get_ident(request)}'
+
+    def get_costs(self, request, view):
+        """
+        (scope, bucket key, tokens) of the request. Bids without a valid
+        `item` are left to validation.
+        """
+        ident = self.get_user_ident(request)
+        if view.action == 'bulk':
+            rows = request.data if isinstance(request.data, list) else []
+            scope, item_scope, prefix = 'bulk', 'bulk_item', 'bid-bulk'
+        else:
+            rows = [request.data]
+            scope, item_scope, prefix = 'user', 'user_item', 'bid'
+        costs = [(scope, f'{prefix}:{ident}', max(len(rows), 1))]
+        items = Counter(int(row['item']) for row in rows
+                        if hasattr(row, 'get') and str(row.get('item') or '').isdigit())
+        costs += [(item_scope, f'{prefix}:{ident}:item-{item}', count)
+                  for item, count in items.items()]
+        return costs
+
+    def allow_request(self, request, view):
+        rates = settings.BID_THROTTLE_RATES
+        costs = [(key, *parse_rate(rates[scope]), cost)
+                 for scope, key, cost in self.get_costs(request, view)
+                 if rates.get(scope)]
+        if not costs:
+            return True
+        self.wait_seconds = get_bid_buckets().take(costs)
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class BidThrottleMixin(object):
+    """
+    Throttles the `throttled_actions` with BidThrottle, the rejected
+    requests get a 429 with Retry-After before the payload is validated.
+    """
+    throttled_actions = ('create', )
+
+    def get_throttles(self):
+        if self.action in self.throttled_actions:
+            return [BidThrottle()]
+        return super().get_throttles()
@@ -1,7 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter, DefaultRouter
 # internals
-from .views import (ItemViewSet,ImageViewSet,BidViewSet, AutoBidViewSet)
+from .metrics import metrics_view
+from .views import (ItemViewSet,ImageViewSet,BidViewSet, AutoBidViewSet,
+                    SlowRequestsView)
 
 app_name = 'api'
 
@@ -14,4 +16,6 @@ router.register(r'autobids', AutoBidViewSet, basename='autobids')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('_metrics', metrics_view, name='metrics'),
+    path('_metrics/slow', SlowRequestsView.as_view(), name='metrics-slow'),
 ]
@@ -1,24 +1,44 @@
+import hashlib
 from rest_framework import viewsets, mixins
 from django.db import IntegrityError
+from django.utils.cache import get_conditional_response
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Max
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
 # internals
-from .models import (Item, Image, Bid, AutoBid)
-from .pagiantion import CustomPagination
-from .filters import (ItemFilter, AutoBidFilter)
+from .cache import item_version, get_item_detail, set_item_detail
+from .export import BID_COLUMNS, ITEM_COLUMNS, export_response
+from .fieldsets import ValuesListMixin, requested_fields
+from .models import (Item, Image, Bid, AutoBid, ItemStats)
+from .pagiantion import CustomPagination, BidCursorPagination
+from .filters import (ItemFilter, AutoBidFilter, BidExportFilter,
+                      ItemExportFilter)
+from .idempotency import IdempotentCreateMixin
+from .metrics import get_registry
+from .replicas import ReplicaStickinessMixin, pin_primary
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .services import BidService
+from .throttling import BidThrottleMixin
 from .serializers import (ItemSerializer,
                           ImageSerializer,
                           BidSerializer,
+                          BulkBidSerializer,
                           ItemDetailSerializer,
+                          ItemBidSerializer,
                           AutoBidSerializer,
-                          AutoBidUpdateSerializer
+                          AutoBidUpdateSerializer,
+                          ItemStatsSerializer,
                           )
 
 
-class BaseViewSet(mixins.ListModelMixin,
+class BaseViewSet(ReplicaStickinessMixin,
+                  ValuesListMixin,
+                  mixins.ListModelMixin,
                   mixins.RetrieveModelMixin,
                   mixins.CreateModelMixin,
                   mixins.UpdateModelMixin,
@@ -31,11 +51,13 @@ class ItemViewSet(BaseViewSet):
 
     pagination_class = CustomPagination
     filterset_class = ItemFilter
+    stats_max_items = 100
 
     def get_queryset(self):
         queryset = Item.objects.all()
-        if self.action == 'retrieve':
-            queryset = queryset.annotate(max_bid_value=Max('bids__value'))
+        if self.action == 'retrieve' or (
+                self.action == 'list' and requested_fields(self.request, ['images'])):
+            queryset = queryset.prefetch_related('images')
         return queryset
 
     def get_serializer_class(self):
@@ -43,6 +65,98 @@ class ItemViewSet(BaseViewSet):
             return ItemDetailSerializer
         return ItemSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Detail is cached per item version, the version also gives the
+        ETag, so an unchanged item is answered with a 304 or from the
+        cache without touching the database. A 304 is only answered for
+        a detail that is cached or read, never for an unknown item. No
+        Last-Modified: its one second granularity would hide the bids of
+        the same second. ?fields= / ?omit= narrow the cached detail, each
+        field set has its own ETag.
+        """
+        item_id = kwargs[self.lookup_field]
+        version = item_version(item_id)
+
+        data = get_item_detail(item_id, version)
+        if data is None:
+            # cached for everybody under the new version, a lagging
+            # replica must not fill it
+            pin_primary()
+            data = super().retrieve(request, *args, **kwargs).data
+            set_item_detail(item_id, version, data)
+
+        names = requested_fields(request, data)
+        etag = f'"{item_id}-{version}"'
+        if len(names) != len(data):
+            # a narrowed detail is another representation, another ETag
+            digest = hashlib.md5(','.join(names).encode()).hexdigest()[:8]
+            etag = f'"{item_id}-{version}-{digest}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        data = {name: data[name] for name in names}
+        return Response(data, headers={'ETag': etag})
+
+    @action(detail=True, methods=['get'])
+    def bids(self, request, pk=None):
+        item = self.get_object()
+        queryset = item.bids.select_related('made_by')
+        paginator = BidCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ItemBidSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Bid analytics of the item from the stats rollup, see api.stats.
+        """
+        stats = self.get_stats([int(pk)]) if pk.isdigit() else []
+        if not stats:
+            raise NotFound()
+        return Response(ItemStatsSerializer(stats[0]).data)
+
+    @action(detail=False, methods=['get'], url_path='stats',
+            url_name='bulk-stats')
+    def bulk_stats(self, request):
+        """
+        Stats of the items in ?ids=1,2,3, unknown ones left out.
+        """
+        try:
+            ids = [int(pk) for pk in request.query_params.get('ids', '').split(',') if pk]
+        except ValueError:
+            ids = None
+        if not ids or len(ids) > self.stats_max_items:
+            return Response({'error': f'Expected ?ids= with 1 to {self.stats_max_items} item ids.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(ItemStatsSerializer(self.get_stats(ids), many=True).data)
+
+    def get_stats(self, item_ids):
+        """
+        ItemStats of the items in order, unsaved empty ones for the items
+        without bids yet.
+        """
+        stats = {stats.item_id: stats for stats in ItemStats.objects.filter(
+            item_id__in=item_ids).prefetch_related('buckets')}
+        missing = set(item_ids) - set(stats)
+        if missing:
+            missing &= set(Item.objects.filter(pk__in=missing).values_list('pk', flat=True))
+        return [stats.get(item_id) or ItemStats(item_id=item_id)
+                for item_id in item_ids
+                if item_id in stats or item_id in missing]
+
+    @action(detail=False, methods=['get'], filterset_class=ItemExportFilter,
+            renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Streams the items by id as CSV, or NDJSON with ?format=ndjson.
+        Filters: item, since/until (close_datetime), closed.
+        """
+        queryset = self.filter_queryset(Item.objects.order_by('id'))
+        return export_response(queryset, ITEM_COLUMNS,
+                               request.accepted_renderer.format, 'items')
+
 
 class ImageViewSet(BaseViewSet):
     def get_queryset(self):
@@ -53,7 +167,12 @@ class ImageViewSet(BaseViewSet):
         return ImageSerializer
 
 
-class BidViewSet(BaseViewSet):
+class BidViewSet(BidThrottleMixin, IdempotentCreateMixin, BaseViewSet):
+    bulk_max_size = 10000
+    throttled_actions = ('create', 'bulk')
+    # set by the export action
+    filterset_class = None
+
     def get_queryset(self):
         queryset = Bid.objects.all()
         return queryset
@@ -68,10 +187,65 @@ class BidViewSet(BaseViewSet):
             return Response({'error': 'IntegrityError: your bid value must be higher than max value for this item!'},
                             status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'],
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Places a JSON array (or NDJSON stream) of bids in one transaction,
+        in order. Every bid gets a result, rejecting one doesn't reject
+        the others.
+        """
+        return self.idempotent(request, lambda: self.place_bulk(request))
+
+    def place_bulk(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a list of bids.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.bulk_max_size:
+            return Response({'error': f'At most {self.bulk_max_size} bids per request.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results, bids, positions = [None] * len(rows), [], []
+        for position, row in enumerate(rows):
+            serializer = BulkBidSerializer(data=row)
+            if not serializer.is_valid():
+                results[position] = {'status': 'rejected',
+                                     'errors': serializer.errors}
+                continue
+            data = serializer.validated_data
+            bids.append((data['item'], data['value'], data['made_by']))
+            positions.append(position)
+
+        placements = BidService().place_bids(bids) if bids else []
+        for position, placement in zip(positions, placements):
+            if placement.error is None:
+                results[position] = {'status': 'accepted',
+                                     'id': placement.bid.id}
+            else:
+                results[position] = {'status': 'rejected',
+                                     'error': str(placement.error),
+                                     'errors': placement.error.errors}
+        accepted = sum(result['status'] == 'accepted' for result in results)
+        return Response({'accepted': accepted,
+                         'rejected': len(results) - accepted,
+                         'results': results})
 
-class AutoBidViewSet(BaseViewSet):
+    @action(detail=False, methods=['get'], filterset_class=BidExportFilter,
+            renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Streams the bids by id as CSV, or NDJSON with ?format=ndjson.
+        Filters: item, made_by, since/until (created_date), closed.
+        """
+        queryset = self.filter_queryset(Bid.objects.order_by('id'))
+        return export_response(queryset, BID_COLUMNS,
+                               request.accepted_renderer.format, 'bids')
+
+
+class AutoBidViewSet(BidThrottleMixin, IdempotentCreateMixin, BaseViewSet):
     filterset_class = AutoBidFilter
-    queryset = AutoBid.objects.all()
+    queryset = AutoBid.objects.select_related('item')
 
     def get_queryset(self):
         return self.queryset
@@ -80,3 +254,13 @@ class AutoBidViewSet(BaseViewSet):
         if self.action == 'update':
             return AutoBidUpdateSerializer
         return AutoBidSerializer
+
+
+class SlowRequestsView(APIView):
+    """
+    The slow requests sampled by the metrics middleware, newest last.
+    """
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request):
+        return Response(list(get_registry().slow))
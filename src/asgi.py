@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# bid streams (/ws/items/{id}/, /api/v1/items/{id}/stream/) are served
+# here, next to Django
+from api.asgi import stream_router  # noqa: E402
+
+application = stream_router(django_application)
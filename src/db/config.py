@@ -0,0 +1,56 @@
+def database_from_env(environ, default_name):
+    """
+    The `default` database of a deployment from environment variables.
+
+    DB_ENGINE=postgresql: DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT,
+    DB_CONN_MAX_AGE (seconds a connection is kept, 60) and
+    DB_HEALTH_CHECK_INTERVAL (30). DB_POOL_MAX_SIZE turns the per-process
+    pool on (connections are then returned at the end of each request),
+    DB_POOL_TIMEOUT is how long a request waits for one (10).
+
+    DB_ENGINE=sqlite3 (default): DB_NAME (the file, `default_name` if unset)
+    with WAL, and DB_BUSY_TIMEOUT (ms a writer waits for the lock, 5000).
+    """
+    engine = environ.get('DB_ENGINE', 'sqlite3')
+    if engine == 'postgresql':
+        database = {
+            'ENGINE': 'src.db.postgresql',
+            'NAME': environ.get('DB_NAME', 'auction'),
+            'USER': environ.get('DB_USER', ''),
+            'PASSWORD': environ.get('DB_PASSWORD', ''),
+            'HOST': environ.get('DB_HOST', 'localhost'),
+            'PORT': environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(environ.get('DB_CONN_MAX_AGE', 60)),
+            'HEALTH_CHECK_INTERVAL': int(environ.get('DB_HEALTH_CHECK_INTERVAL', 30)),
+        }
+        if environ.get('DB_POOL_MAX_SIZE'):
+            database['CONN_MAX_AGE'] = 0
+            database['POOL'] = {
+                'MAX_SIZE': int(environ['DB_POOL_MAX_SIZE']),
+                'TIMEOUT': float(environ.get('DB_POOL_TIMEOUT', 10)),
+            }
+        return database
+    if engine == 'sqlite3':
+        return {
+            'ENGINE': 'src.db.sqlite3',
+            'NAME': environ.get('DB_NAME', default_name),
+            'PRAGMAS': {'busy_timeout': int(environ.get('DB_BUSY_TIMEOUT', 5000))},
+        }
+    raise ValueError(f'unsupported DB_ENGINE {engine!r}')
+
+
+def replicas_from_env(environ, primary):
+    """
+    Read replicas of `primary` as extra DATABASES aliases (replica1, ...):
+    DB_REPLICA_HOSTS, comma separated, for PostgreSQL, DB_REPLICA_NAMES,
+    comma separated files, for SQLite (e.g. a copy of the primary to try
+    the routing locally). Tests use the primary in their place.
+    """
+    key = 'HOST' if 'postgresql' in primary['ENGINE'] else 'NAME'
+    values = environ.get(f'DB_REPLICA_{key}S', '')
+    return {
+        f'replica{number}': {**primary, key: value.strip(),
+                             'TEST': {'MIRROR': 'default'}}
+        for number, value in enumerate(
+            (value for value in values.split(',') if value.strip()), 1)
+    }
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of DB-API connections shared by the threads of a process
+    (WSGI worker threads, or the ASGI app's sync threads). At most
+    `max_size` connections exist at once, a caller waits up to `timeout`
+    seconds for one. A connection idle for longer than
+    `health_check_interval` is pinged before being handed out again.
+    """
+
+    def __init__(self, connect, max_size, timeout, health_check_interval):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.idle = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'no connection available within {self.timeout}s '
+                              f'(pool size {self.max_size})')
+        try:
+            while True:
+                with self.lock:
+                    # most recently returned first, the others may expire
+                    entry = self.idle.pop() if self.idle else None
+                if entry is None:
+                    return self.connect()
+                connection, returned_at = entry
+                if (time.monotonic() - returned_at < self.health_check_interval
+                        or self.is_usable(connection)):
+                    return connection
+                self.discard(connection)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection, reusable=True):
+        try:
+            if reusable and self.reset(connection):
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+            else:
+                self.discard(connection)
+        finally:
+            self.slots.release()
+
+    def reset(self, connection) -> bool:
+        try:
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def is_usable(self, connection) -> bool:
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, deque()
+        for connection, _ in idle:
+            self.discard(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, connect, max_size, timeout, health_check_interval):
+    """
+    The pool of a database alias in this process. Keyed by pid too, so a
+    worker forked after the pool was created doesn't share its sockets.
+    """
+    key = (os.getpid(), alias)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                connect, max_size, timeout, health_check_interval)
+        return pool
@@ -0,0 +1,64 @@
+import time
+from django.db.backends.postgresql import base
+# internals
+from src.db.pool import PoolTimeout, get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL with health checks and an optional connection pool.
+
+    HEALTH_CHECK_INTERVAL (seconds): a persistent connection (CONN_MAX_AGE)
+    unused for longer is pinged when a request starts, and replaced if
+    the server went away, instead of failing the request.
+
+    POOL = {'MAX_SIZE': .., 'TIMEOUT': ..}: connections are taken from a
+    bounded per-process pool and given back to it when Django closes them,
+    so CONN_MAX_AGE should be 0.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = None
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        return get_pool(self.alias, self._connect,
+                        max_size=options.get('MAX_SIZE', 10),
+                        timeout=options.get('TIMEOUT', 10),
+                        health_check_interval=self.health_check_interval)
+
+    @property
+    def health_check_interval(self):
+        return self.settings_dict.get('HEALTH_CHECK_INTERVAL', 30)
+
+    def _connect(self):
+        return super().get_new_connection(self.get_connection_params())
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            return pool.acquire()
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e))
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.release(self.connection, reusable=not self.errors_occurred)
+
+    def close_if_unusable_or_obsolete(self):
+        if (self.connection is not None and self.pool is None and
+                self.last_used is not None and
+                time.monotonic() - self.last_used > self.health_check_interval and
+                not self.is_usable()):
+            self.close()
+        super().close_if_unusable_or_obsolete()
+        self.last_used = time.monotonic()
@@ -0,0 +1,24 @@
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    # readers don't block the writer and the other way around
+    'journal_mode': 'WAL',
+    # durable at checkpoints, enough with WAL and much fewer fsyncs
+    'synchronous': 'NORMAL',
+    # ms a writer waits for the lock instead of failing right away
+    'busy_timeout': 5000,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite for a single-node deployment: every new connection gets the
+    PRAGMAS setting, merged over DEFAULT_PRAGMAS.
+    """
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
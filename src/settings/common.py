@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -121,6 +123,11 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Uploaded images and their variants; point MEDIA_URL at a CDN in front
+# of MEDIA_ROOT in production
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -129,14 +136,110 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # orjson when installed, see api.renderers
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     # 'DEFAULT_PERMISSION_CLASSES': (
     #     'rest_framework.permissions.IsAuthenticated',
     # )
 }
 
+# List actions serialize .values() rows instead of model instances where
+# the serializer supports it, see api.fieldsets
+API_VALUES_LISTS = True
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Worker processes serving requests. With more than one the default cache
+# must be shared (memcached, ...), the app refuses to start on locmem.
+WEB_WORKERS = 1
+
+# Seconds a serialized item detail stays cached, it is invalidated on
+# every Bid/Image/Item write anyway
+ITEM_DETAIL_CACHE_TIMEOUT = 300
+
+# Worker threads running bid side effects after commit. Eager runs them
+# inline in the on_commit callback instead (tests, management commands).
+BID_DISPATCH_WORKERS = 4
+BID_DISPATCH_EAGER = False
+
+# Where bid/close events are published for the ASGI item streams. The
+# local backend only reaches watchers connected to the same process.
+BID_STREAM_BACKEND = 'api.stream.LocalBackend'
+
+# In-memory AutoBid order books used to resolve proxy bids: how many items
+# are kept, and the seconds after which a book is reloaded and checked
+# against the database (changes from other processes aren't signalled).
+AUTOBID_BOOK_ENABLED = True
+AUTOBID_BOOK_MAX_ITEMS = 10000
+AUTOBID_BOOK_TTL = 60
+
+# Seconds the response to a request with an Idempotency-Key is replayed
+# for, and after which a key whose request never finished is released
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TTL = 60
+
+# Users resolved from JWTs kept in memory, and the seconds after which one
+# is read again (saves in this process evict it right away)
+JWT_USER_CACHE_SIZE = 10000
+JWT_USER_CACHE_TTL = 300
+
+# Token buckets throttling bid and autobid placement per user and per user
+# and item, bulk placements take a token per bid from their own 'bulk' and
+# 'bulk_item' buckets: '20/min' allows bursts of 20, then one every 3
+# seconds. The local backend keeps the BID_THROTTLE_MAX_KEYS most recent
+# buckets in each process, api.throttling.CacheBuckets shares them in
+# BID_THROTTLE_CACHE.
+BID_THROTTLE_RATES = {
+    'user': '60/min',
+    'user_item': '20/min',
+    'bulk': '1000/min',
+    'bulk_item': '200/min',
+}
+BID_THROTTLE_BACKEND = 'api.throttling.LocalBuckets'
+BID_THROTTLE_CACHE = 'default'
+BID_THROTTLE_MAX_KEYS = 100000
+
+# Per-view request metrics served at /api/v1/_metrics to staff users and
+# the METRICS_ALLOWED_IPS (the scrapers, REMOTE_ADDR as seen by Django).
+# With a threshold (seconds), slower requests are kept with their SQL, the
+# last METRICS_SLOW_BUFFER of them, at /api/v1/_metrics/slow (staff only).
+METRICS_ENABLED = True
+METRICS_ALLOWED_IPS = []
+METRICS_SLOW_THRESHOLD = None
+METRICS_SLOW_BUFFER = 100
+
+# Read replicas: aliases of DATABASES that safe-method requests read from,
+# and the seconds a user's reads stay on the primary after a write
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_STICKY_SECONDS = 10
+
+# Width of the price series buckets of the item stats, rebuild them with
+# `rebuild_item_stats` after changing it
+ITEM_STATS_BUCKET_SECONDS = 60
+
+# Rows fetched per round trip by the streaming CSV/NDJSON exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Image variants rendered after an upload: widths (px, never upscaled)
+# in each format, by IMAGE_VARIANT_WORKERS processes. Eager renders them
+# inline in the on_commit callback instead (tests).
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANT_EAGER = False
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -1,4 +1,6 @@
+import os
 from .common import *
+from src.db.config import replicas_from_env
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -14,3 +16,7 @@ DATABASES = {
         'NAME': BASE_DIR / 'dev.sqlite3',
     }
 }
+
+# e.g. DB_REPLICA_NAMES=dev-replica.sqlite3, a copy of dev.sqlite3
+DATABASES.update(replicas_from_env(os.environ, DATABASES['default']))
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
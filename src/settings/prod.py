@@ -1,4 +1,6 @@
+import os
 from .common import *
+from src.db.config import database_from_env, replicas_from_env
 
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -9,9 +11,20 @@ ALLOWED_HOSTS = []
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# driven by DB_* environment variables, see src.db.config
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'prod.sqlite3',
+    'default': database_from_env(os.environ, BASE_DIR / 'prod.sqlite3'),
+}
+DATABASES.update(replicas_from_env(os.environ, DATABASES['default']))
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# e.g. CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache
+# and CACHE_LOCATION=127.0.0.1:11211, shared by the WEB_CONCURRENCY workers
+if os.environ.get('CACHE_BACKEND'):
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ['CACHE_BACKEND'],
+            'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+        }
     }
-}
\ No newline at end of file
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from api.jwt import (
@@ -8,4 +10,4 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/token/', TokenObtainView.as_view(), name='token_obtain'),
     path('api/v1/', include('api.urls'))
-]
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)